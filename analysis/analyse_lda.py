@@ -1,10 +1,15 @@
+import os
 import numpy as np
+from itertools import combinations
+from scipy.spatial.distance import pdist
 import matplotlib.pyplot as plt
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
-from sklearn.preprocessing import StandardScaler
 import pandas as pd
 import seaborn as sns
-from model.classification_utils import prepare_features, load_data
+from model.classification_utils import load_or_compute_features, zscore_inplace, class_centroids
+
+# Set BONSAI_PLOT=0 for headless batch runs; rendering and 150 dpi PNG encoding are then skipped
+PLOT = os.environ.get("BONSAI_PLOT", "1") == "1"
 
 def visualize_with_lda(X, y, class_names=['Dry', 'Moist', 'Wet']):
     """
@@ -12,56 +17,61 @@ def visualize_with_lda(X, y, class_names=['Dry', 'Moist', 'Wet']):
     LDA focuses on maximizing class separation, ideal for classification tasks.
     """
     # Scale features before applying LDA
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    X_scaled = zscore_inplace(X)
     
     print("Applying LDA dimensionality reduction...")
     # Apply LDA to reduce to 2 components (n_components must be <= n_classes - 1)
-    lda = LinearDiscriminantAnalysis(n_components=2)
+    # The eigen solver forms S_w / S_b with one gemm each and solves the symmetric
+    # generalized problem eigh(S_b, S_w) directly (LAPACK sygvd)
+    lda = LinearDiscriminantAnalysis(n_components=2, solver='eigen')
     X_lda = lda.fit_transform(X_scaled, y)
     
     # Get explained variance ratio
     explained_variance = lda.explained_variance_ratio_
     cumulative_variance = np.sum(explained_variance)
     
-    # Create visualization with better styling
-    plt.figure(figsize=(12, 8))
-    
-    # Use seaborn for better styling
-    sns.scatterplot(x=X_lda[:, 0], y=X_lda[:, 1],
-                   hue=y, style=y,
-                   markers=['o', 's', '^'],
-                   palette='deep',
-                   s=100)
-    
-    plt.title('LDA Visualization of Soil Moisture Classes', 
-             fontsize=16, pad=20)
-    plt.xlabel(f'LD1 ({explained_variance[0]:.1%} discrimination)', 
-             fontsize=14)
-    plt.ylabel(f'LD2 ({explained_variance[1]:.1%} discrimination)', 
-             fontsize=14)
-    
-    # Enhance legend
-    plt.legend(title='Moisture Level', title_fontsize=12, fontsize=10)
-    plt.grid(True, alpha=0.3)
-    
-    # # Add annotation about class separation
-    # plt.figtext(0.5, 0.02,
-    #            f"LDA captures {cumulative_variance:.1%} of class discrimination power",
-    #            ha="center", fontsize=12,
-    #            bbox={"facecolor":"lightgreen", "alpha":0.2, "pad":5})
-    
-    plt.tight_layout()
-    plt.savefig('soil_moisture_lda_visualization.png', dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    # Plot feature importance
-    plot_feature_importance(lda, X.shape[1])
+    if PLOT:
+        # Create visualization with better styling
+        plt.figure(figsize=(12, 8))
+    
+        # Use seaborn for better styling
+        sns.scatterplot(x=X_lda[:, 0], y=X_lda[:, 1],
+                       hue=y, style=y,
+                       markers=['o', 's', '^'],
+                       palette='deep',
+                       s=100)
+    
+        plt.title('LDA Visualization of Soil Moisture Classes', 
+                 fontsize=16, pad=20)
+        plt.xlabel(f'LD1 ({explained_variance[0]:.1%} discrimination)', 
+                 fontsize=14)
+        plt.ylabel(f'LD2 ({explained_variance[1]:.1%} discrimination)', 
+                 fontsize=14)
+    
+        # Enhance legend
+        plt.legend(title='Moisture Level', title_fontsize=12, fontsize=10)
+        plt.grid(True, alpha=0.3)
+    
+        # # Add annotation about class separation
+        # plt.figtext(0.5, 0.02,
+        #            f"LDA captures {cumulative_variance:.1%} of class discrimination power",
+        #            ha="center", fontsize=12,
+        #            bbox={"facecolor":"lightgreen", "alpha":0.2, "pad":5})
+    
+        plt.tight_layout()
+        plt.savefig('soil_moisture_lda_visualization.png', dpi=150, bbox_inches='tight')
+        plt.show()
+    
+        # Plot feature importance
+        plot_feature_importance(lda, X.shape[1])
     
     return X_lda, lda
 
 def plot_feature_importance(lda, n_features, top_n=10):
     """Plot the most discriminative features identified by LDA"""
+    if not PLOT:
+        return
+    
     # Get feature coefficients
     coefficients = lda.coef_
     
@@ -94,39 +104,26 @@ def plot_feature_importance(lda, n_features, top_n=10):
                 ha='left', va='center', fontsize=10)
     
     plt.tight_layout()
-    plt.savefig('lda_feature_importance.png', dpi=300, bbox_inches='tight')
+    plt.savefig('lda_feature_importance.png', dpi=150, bbox_inches='tight')
     plt.show()
 
 def calculate_class_metrics(X_lda, y):
     """Calculate and return class separation metrics"""
-    classes = np.unique(y)
-    centroids = []
-    spreads = []
-    
-    # Calculate centroids and spreads for each class
-    for class_val in classes:
-        mask = y == class_val
-        class_points = X_lda[mask]
-        centroid = np.mean(class_points, axis=0)
-        spread = np.mean(np.linalg.norm(class_points - centroid, axis=1))
-        centroids.append(centroid)
-        spreads.append(spread)
+    classes, centroids, labels_idx = class_centroids(X_lda, y)
+    
+    # Spread: mean distance of each point to its own class centroid, grouped in one pass
+    diffs = X_lda - centroids[labels_idx]
+    dists = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+    spreads = np.bincount(labels_idx, weights=dists) / np.bincount(labels_idx)
     
     # Calculate inter-class distances
-    distances = []
-    for i in range(len(centroids)):
-        for j in range(i + 1, len(centroids)):
-            dist = np.linalg.norm(centroids[i] - centroids[j])
-            distances.append((classes[i], classes[j], dist))
+    distances = [(c1, c2, dist) for (c1, c2), dist in zip(combinations(classes, 2), pdist(centroids))]
     
     return centroids, spreads, distances
 
 def main():
-    print("Loading soil moisture image dataset...")
-    df, image_dir = load_data("../new_samples/samples.csv", "../new_samples")
-    
-    print("Extracting features from images...")
-    X, y = prepare_features(df, image_dir, normalize=True, augment=False)
+    print("Loading soil moisture image features...")
+    X, y = load_or_compute_features("../new_samples/samples.csv", "../new_samples", normalize=True, augment=False)
     
     print(f"Dataset: {len(X)} samples with {X.shape[1]} features")
     print(f"Class distribution: {pd.Series(y).value_counts().sort_index().to_dict()}")
@@ -152,6 +149,8 @@ def main():
     print(f"LD1: {explained_variance[0]:.2%}")
     print(f"LD2: {explained_variance[1]:.2%}")
     print(f"Total: {np.sum(explained_variance):.2%}")
+    
+    return X_lda, lda_model
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
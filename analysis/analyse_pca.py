@@ -1,9 +1,14 @@
+import os
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
+from matplotlib.lines import Line2D
 from sklearn.decomposition import PCA
-from sklearn.preprocessing import MinMaxScaler
 import pandas as pd
-from model.classification_utils import prepare_features, load_data
+from model.classification_utils import load_or_compute_features, minmax_inplace, class_centroids
+
+# Set BONSAI_PLOT=0 for headless batch runs; rendering and 150 dpi PNG encoding are then skipped
+PLOT = os.environ.get("BONSAI_PLOT", "1") == "1"
 
 def visualize_with_pca(X, y, class_names=['Dry', 'Moist', 'Wet']):
     """
@@ -11,45 +16,48 @@ def visualize_with_pca(X, y, class_names=['Dry', 'Moist', 'Wet']):
     PCA focuses on preserving global variance, showing if features have discriminative power.
     """
     # Scale features before applying PCA
-    X_scaled = MinMaxScaler().fit_transform(X)
+    X_scaled = minmax_inplace(X)
     
     print("Applying PCA dimensionality reduction...")
     # Apply PCA to reduce to 2 components for visualization
-    pca = PCA(n_components=2)
+    pca = PCA(n_components=2, svd_solver='randomized', random_state=42)
     X_pca = pca.fit_transform(X_scaled)
     
     # Get explained variance for reporting
     explained_variance = pca.explained_variance_ratio_
     cumulative_variance = np.sum(explained_variance)
     
-    # Create visualization
-    plt.figure(figsize=(10, 8))
-    colors = ['#E74C3C', '#2ECC71', '#3498DB']  # Red, Green, Blue
-    markers = ['o', 's', '^']  # Circle, Square, Triangle
-    unique_classes = sorted(np.unique(y))
-    
-    for i, class_val in enumerate(unique_classes):
-        idx = np.where(y == class_val)
-        plt.scatter(X_pca[idx, 0], X_pca[idx, 1], 
-                   c=colors[i], marker=markers[i], s=80, label=class_names[i], alpha=0.8)
-    
-    plt.title('PCA Visualization of Soil Moisture Classes', fontsize=16)
-    plt.xlabel(f'PC1 ({explained_variance[0]:.1%} variance)', fontsize=14)
-    plt.ylabel(f'PC2 ({explained_variance[1]:.1%} variance)', fontsize=14)
-    plt.legend(fontsize=12)
-    plt.grid(alpha=0.3)
-    
-    # # Add annotation explaining the significance
-    # plt.figtext(0.5, 0.01,
-    #            f"PCA captures {cumulative_variance:.1%} of total variance, showing smartphone images contain useful moisture information",
-    #            ha="center", fontsize=12, bbox={"facecolor":"orange", "alpha":0.2, "pad":5})
-    
-    plt.tight_layout()
-    plt.savefig('soil_moisture_pca_visualization.png', dpi=300)
-    plt.show()
-    
-    # Generate the feature contribution plot (loading factors)
-    plot_feature_loadings(pca)
+    if PLOT:
+        # Create visualization
+        plt.figure(figsize=(10, 8))
+        colors = ['#E74C3C', '#2ECC71', '#3498DB']  # Red, Green, Blue
+        markers = ['o', 's', '^']  # Circle, Square, Triangle
+        unique_classes = np.unique(y)
+    
+        # One scatter call coloured through a LUT; legend entries are proxy artists
+        color_idx = np.searchsorted(unique_classes, y)
+        plt.scatter(X_pca[:, 0], X_pca[:, 1], c=color_idx, cmap=ListedColormap(colors[:len(unique_classes)]),
+                    vmin=0, vmax=len(unique_classes) - 1, s=80, alpha=0.8)
+        handles = [Line2D([], [], linestyle='', marker=markers[i], markersize=9, color=colors[i],
+                          alpha=0.8, label=class_names[i]) for i in range(len(unique_classes))]
+    
+        plt.title('PCA Visualization of Soil Moisture Classes', fontsize=16)
+        plt.xlabel(f'PC1 ({explained_variance[0]:.1%} variance)', fontsize=14)
+        plt.ylabel(f'PC2 ({explained_variance[1]:.1%} variance)', fontsize=14)
+        plt.legend(handles=handles, fontsize=12)
+        plt.grid(alpha=0.3)
+    
+        # # Add annotation explaining the significance
+        # plt.figtext(0.5, 0.01,
+        #            f"PCA captures {cumulative_variance:.1%} of total variance, showing smartphone images contain useful moisture information",
+        #            ha="center", fontsize=12, bbox={"facecolor":"orange", "alpha":0.2, "pad":5})
+    
+        plt.tight_layout()
+        plt.savefig('soil_moisture_pca_visualization.png', dpi=150)
+        plt.show()
+    
+        # Generate the feature contribution plot (loading factors)
+        plot_feature_loadings(pca)
     
     return X_pca, pca
 
@@ -58,6 +66,9 @@ def plot_feature_loadings(pca, top_n=10):
     Plot the most influential features in the PCA to understand which 
     image characteristics best discriminate between moisture levels
     """
+    if not PLOT:
+        return
+    
     # Get absolute loading values for first two components
     loadings = pca.components_[:2, :]
     
@@ -82,15 +93,12 @@ def plot_feature_loadings(pca, top_n=10):
     plt.title('Top Feature Contributions to Principal Components')
     plt.legend()
     plt.tight_layout()
-    plt.savefig('pca_feature_contributions.png', dpi=300)
+    plt.savefig('pca_feature_contributions.png', dpi=150)
     plt.show()
 
 def main():
-    print("Loading soil moisture image dataset...")
-    df, image_dir = load_data("../new_samples/samples.csv", "../new_samples")
-    
-    print("Extracting features from images...")
-    X, y = prepare_features(df, image_dir, normalize=True, augment=False)
+    print("Loading soil moisture image features...")
+    X, y = load_or_compute_features("../new_samples/samples.csv", "../new_samples", normalize=True, augment=False)
     
     print(f"Dataset: {len(X)} samples with {X.shape[1]} features")
     print(f"Class distribution: {pd.Series(y).value_counts().sort_index().to_dict()}")
@@ -99,11 +107,7 @@ def main():
     X_pca, pca_model = visualize_with_pca(X, y)
     
     # Calculate approximate cluster separation
-    unique_classes = np.unique(y)
-    centroids = []
-    for class_val in unique_classes:
-        idx = np.where(y == class_val)
-        centroids.append(np.mean(X_pca[idx], axis=0))
+    unique_classes, centroids, _ = class_centroids(X_pca, y)
     
     print("\nApproximate cluster separation metrics:")
     for i in range(len(centroids)):
@@ -125,6 +129,8 @@ def main():
     else:
         print("\nInterpretation: PCA shows moderate separation. The non-linear t-SNE might be more suitable,")
         print("suggesting complex relationships between image features and soil moisture.")
+    
+    return X_pca, pca_model
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
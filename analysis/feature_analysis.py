@@ -2,37 +2,116 @@ import os
 import numpy as np
 import pandas as pd
 import cv2
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
 from sklearn.decomposition import PCA
 # from sklearn.manifold import TSNE
-from sklearn.cluster import KMeans, DBSCAN
+from sklearn.cluster import MiniBatchKMeans, DBSCAN
 from scipy.stats import f_oneway
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.preprocessing import StandardScaler
+from model.classification_utils import zscore_inplace
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _reduce_channels(image, hsv, lab, gray):
+        """
+        Fused reduction over all colour spaces in one sweep of the pixels.
+        Accumulates sum / sum of squares for the 9 channels and the 32-bin
+        grayscale histogram (bucketed by gray >> 3), then derives entropy.
+        gray comes from cv2.COLOR_BGR2GRAY so the histogram matches the
+        non-numba path bin for bin.
+        """
+        h, w = image.shape[:2]
+        sums = np.zeros(9)
+        sumsq = np.zeros(3)  # std is only needed for the image channels
+        hist = np.zeros(32, dtype=np.int64)
+        for i in range(h):
+            for j in range(w):
+                for k in range(3):
+                    v = float(image[i, j, k])
+                    sums[k] += v
+                    sumsq[k] += v * v
+                    sums[3 + k] += hsv[i, j, k]
+                    sums[6 + k] += lab[i, j, k]
+                hist[gray[i, j] >> 3] += 1
+        n = h * w
+        means = sums / n
+        rgb_mean = means[0:3]
+        rgb_std = np.sqrt(np.maximum(sumsq / n - rgb_mean * rgb_mean, 0.0))
+        entropy = 0.0
+        for b in range(32):
+            p = hist[b] / n
+            entropy -= p * np.log2(p + 1e-10)
+        return rgb_mean, rgb_std, means[3:6], means[6:9], hist, entropy
+
+    # Compile (or load from the on-disk cache) at import rather than on the first image
+    _reduce_channels(np.zeros((1, 1, 3), np.uint8), np.zeros((1, 1, 3), np.uint8),
+                     np.zeros((1, 1, 3), np.uint8), np.zeros((1, 1), np.uint8))
+
+# Set BONSAI_PLOT=0 for headless batch runs; all figure rendering is then skipped
+PLOT = os.environ.get("BONSAI_PLOT", "1") == "1"
+
+# libjpeg-turbo decodes with SIMD IDCT/Huffman; fall back to cv2.imread when it is unavailable
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _jpeg = None
 
 # Example function to extract features from an image
 def extract_features(image):
-    # Convert to different color spaces
-    rgb_mean = np.mean(image, axis=(0, 1))  # RGB mean
-    rgb_std = np.std(image, axis=(0, 1))    # RGB std
-    
+    # Convert to different color spaces (already C code inside OpenCV)
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    hsv_mean = np.mean(hsv, axis=(0, 1))  # HSV mean
-    
     lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-    lab_mean = np.mean(lab, axis=(0, 1))  # LAB mean
-    
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    gray_hist = np.histogram(gray, bins=32, range=(0, 256))[0]  # Grayscale histogram
     
-    # Example texture feature: entropy (can be more elaborate)
-    entropy = -np.sum(gray_hist / np.sum(gray_hist) * np.log2(gray_hist / np.sum(gray_hist) + 1e-10))
+    if NUMBA_AVAILABLE:
+        rgb_mean, rgb_std, hsv_mean, lab_mean, gray_hist, entropy = _reduce_channels(image, hsv, lab, gray)
+        return np.concatenate([rgb_mean, rgb_std, hsv_mean, lab_mean, gray_hist, [entropy]])
+    
+    # OpenCV's SIMD reductions work on uint8 directly, with no float64 upcast of the image
+    rgb_mean, rgb_std = (m.ravel() for m in cv2.meanStdDev(image))  # RGB mean / std
+    hsv_mean = np.array(cv2.mean(hsv)[:3])  # HSV mean
+    lab_mean = np.array(cv2.mean(lab)[:3])  # LAB mean
+    gray_hist = cv2.calcHist([gray], [0], None, [32], [0, 256]).ravel()  # Grayscale histogram
+    
+    # Example texture feature: entropy of the 32-bin histogram (can be more elaborate)
+    p = gray_hist / (gray_hist.sum() + 1e-12)
+    entropy = -float((p * np.log2(p + 1e-10)).sum())
     
     # Return all extracted features as a vector
     return np.concatenate([rgb_mean, rgb_std, hsv_mean, lab_mean, gray_hist, [entropy]])
 
-def load_images(dir_path):
-    images = []
+def _init_worker():
+    """Pin BLAS and OpenCV to one thread per worker so the pool does not oversubscribe the cores."""
+    threadpool_limits(1)
+    cv2.setNumThreads(1)
+
+def _extract_one(img_path):
+    """Decode and featurize a single image; runs inside a worker process."""
+    # Global colour statistics are resolution invariant, so let libjpeg decode at 1/4 scale
+    img = None
+    if _jpeg is not None:
+        try:
+            with open(img_path, 'rb') as f:
+                img = _jpeg.decode(f.read(), pixel_format=TJPF_BGR, scaling_factor=(1, 4))
+        except Exception:
+            img = None
+    if img is None:
+        img = cv2.imread(img_path, cv2.IMREAD_REDUCED_COLOR_4)
+    if img is None:
+        return None
+    return extract_features(img)
+
+def load_image_paths(dir_path):
+    paths = []
     labels = []
     prefixes = ['dry', 'humid', 'wet']
     numbers = range(1, 5)  # 0-4
@@ -41,60 +120,30 @@ def load_images(dir_path):
         for num in numbers:
             img_path = os.path.join(dir_path, f"{prefix}{num}.jpg")
             if os.path.exists(img_path):
-                img = cv2.imread(img_path)
-                if img is not None:
-                    images.append(img)
-                    labels.append(prefix)
-    return images, labels
-
-# Load the images from your dataset directory
-images, labels = load_images("data")
-
-if len(images) == 0:
-    raise ValueError("No images were loaded. Check the image directory path and file names.")
-
-# Feature extraction: extract features for all images
-features = [extract_features(img) for img in images]
-features = np.array(features)
-
-# Standardize the feature matrix
-scaler = StandardScaler()
-features_scaled = scaler.fit_transform(features)
-
-# 1. Statistical Comparison (ANOVA)
-df = pd.DataFrame(features_scaled)
-df['label'] = labels
-
-# Split data by label
-dry_features = df[df['label'] == 'dry'].iloc[:, :-1]  # exclude label column
-wet_features = df[df['label'] == 'wet'].iloc[:, :-1]
-humid_features = df[df['label'] == 'humid'].iloc[:, :-1]
-
-# Perform ANOVA for each feature
-num_features = dry_features.shape[1]
-p_values = []
-f_values = []
-
-for i in range(num_features):
-    f_stat, p_val = f_oneway(dry_features.iloc[:, i], 
-                            wet_features.iloc[:, i], 
-                            humid_features.iloc[:, i])
-    f_values.append(f_stat)
-    p_values.append(p_val)
-
-# Print results for each feature
-significant_features = []
-for i, (f_stat, p_val) in enumerate(zip(f_values, p_values)):
-    print(f'Feature {i}: F-statistic = {f_stat:.4f}, p-value = {p_val:.4f}')
-    if p_val < 0.05:
-        significant_features.append(i)
-print(f'Significant features: {significant_features}')
-
-# After performing ANOVA, create visualizations
+                paths.append(img_path)
+                labels.append(prefix)
+    return paths, labels
+
+def extract_features_parallel(paths, labels):
+    """
+    Extract features for every image path across all CPU cores.
+    Each worker does its own decode, so only paths and feature vectors cross process boundaries.
+    Images that fail to decode are dropped together with their label.
+    """
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker) as ex:
+        results = list(ex.map(_extract_one, paths, chunksize=16))
+    kept = [(f, label) for f, label in zip(results, labels) if f is not None]
+    features = [f for f, _ in kept]
+    labels = [label for _, label in kept]
+    return features, labels
+
 def visualize_anova_results(f_values, p_values, significance_level=0.1):
     """
     Create visualizations for ANOVA results
     """
+    if not PLOT:
+        return
+    
     f_values = np.array(f_values)
     p_values = np.array(p_values)
     
@@ -146,42 +195,83 @@ def visualize_anova_results(f_values, p_values, significance_level=0.1):
     plt.tight_layout()
     plt.show()
 
-# Call the visualization function
-visualize_anova_results(f_values, p_values)
-
-# 2. PCA or t-SNE for dimensionality reduction and visualization
-# PCA for dimensionality reduction to 2D
-pca = PCA(n_components=2)
-features_pca = pca.fit_transform(features_scaled)
-
-# Visualize PCA result
-plt.figure(figsize=(8, 6))
-sns.scatterplot(x=features_pca[:, 0], y=features_pca[:, 1], hue=labels, palette='Set1')
-plt.title('PCA of Soil Images')
-plt.xlabel('Principal Component 1')
-plt.ylabel('Principal Component 2')
-plt.show()
-
-# 3. Clustering (K-Means)
-kmeans = KMeans(n_clusters=3)
-labels_kmeans = kmeans.fit_predict(features_scaled)
-
-# Visualize KMeans result
-plt.figure(figsize=(8, 6))
-sns.scatterplot(x=features_pca[:, 0], y=features_pca[:, 1], hue=labels_kmeans, palette='Set1')
-plt.title('K-Means Clustering of Soil Images')
-plt.xlabel('Principal Component 1')
-plt.ylabel('Principal Component 2')
-plt.show()
-
-# # 3. Clustering (DBSCAN)
-# dbscan = DBSCAN(eps=0.5, min_samples=5)
-# labels_dbscan = dbscan.fit_predict(features_scaled)
-
-# # Visualize DBSCAN result
-# plt.figure(figsize=(8, 6))
-# sns.scatterplot(x=features_pca[:, 0], y=features_pca[:, 1], hue=labels_dbscan, palette='Set1')
-# plt.title('DBSCAN Clustering of Soil Images')
-# plt.xlabel('Principal Component 1')
-# plt.ylabel('Principal Component 2')
-# plt.show()
+def main():
+    # Locate the images in your dataset directory
+    paths, labels = load_image_paths("data")
+
+    # Feature extraction: each worker decodes and featurizes its own images
+    features, labels = extract_features_parallel(paths, labels)
+
+    if len(features) == 0:
+        raise ValueError("No images were loaded. Check the image directory path and file names.")
+
+    features = np.array(features)
+
+    # The pool is gone, so the sklearn / BLAS stage below may use every core
+    threadpool_limits(os.cpu_count())
+
+    # Standardize the feature matrix
+    features_scaled = zscore_inplace(features)
+
+    # 1. Statistical Comparison (ANOVA), vectorized across every feature column at once
+    labels_arr = np.asarray(labels)
+    dry_features = features_scaled[labels_arr == 'dry']
+    wet_features = features_scaled[labels_arr == 'wet']
+    humid_features = features_scaled[labels_arr == 'humid']
+
+    f_values, p_values = f_oneway(dry_features, wet_features, humid_features, axis=0)
+
+    # Print results for each feature
+    significant_features = []
+    for i, (f_stat, p_val) in enumerate(zip(f_values, p_values)):
+        print(f'Feature {i}: F-statistic = {f_stat:.4f}, p-value = {p_val:.4f}')
+        if p_val < 0.05:
+            significant_features.append(i)
+    print(f'Significant features: {significant_features}')
+
+    # Call the visualization function
+    visualize_anova_results(f_values, p_values)
+
+    # 2. PCA or t-SNE for dimensionality reduction and visualization
+    # PCA for dimensionality reduction to 2D
+    pca = PCA(n_components=2, svd_solver='randomized', random_state=42)
+    features_pca = pca.fit_transform(features_scaled)
+
+    if PLOT:
+        # Visualize PCA result
+        plt.figure(figsize=(8, 6))
+        sns.scatterplot(x=features_pca[:, 0], y=features_pca[:, 1], hue=labels, palette='Set1')
+        plt.title('PCA of Soil Images')
+        plt.xlabel('Principal Component 1')
+        plt.ylabel('Principal Component 2')
+        plt.show()
+
+    # 3. Clustering (K-Means)
+    kmeans = MiniBatchKMeans(n_clusters=3, batch_size=256, n_init=3, random_state=42)
+    labels_kmeans = kmeans.fit_predict(features_scaled)
+
+    if PLOT:
+        # Visualize KMeans result
+        plt.figure(figsize=(8, 6))
+        sns.scatterplot(x=features_pca[:, 0], y=features_pca[:, 1], hue=labels_kmeans, palette='Set1')
+        plt.title('K-Means Clustering of Soil Images')
+        plt.xlabel('Principal Component 1')
+        plt.ylabel('Principal Component 2')
+        plt.show()
+
+    # # 3. Clustering (DBSCAN)
+    # dbscan = DBSCAN(eps=0.5, min_samples=5)
+    # labels_dbscan = dbscan.fit_predict(features_scaled)
+
+    # # Visualize DBSCAN result
+    # plt.figure(figsize=(8, 6))
+    # sns.scatterplot(x=features_pca[:, 0], y=features_pca[:, 1], hue=labels_dbscan, palette='Set1')
+    # plt.title('DBSCAN Clustering of Soil Images')
+    # plt.xlabel('Principal Component 1')
+    # plt.ylabel('Principal Component 2')
+    # plt.show()
+
+    return f_values, p_values, features_pca, labels_kmeans
+
+if __name__ == "__main__":
+    main()
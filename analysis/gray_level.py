@@ -1,6 +1,19 @@
 import cv2
 import numpy as np
 
+def calibration_lut(min_val, max_val, white_ref=255, black_ref=0):
+    """
+    256-entry uint8 table stretching [min_val, max_val] onto [black_ref, white_ref].
+    Built with exact integer floor division, so no float image is ever created and
+    levels truncate like the original float stretch's astype(np.uint8), which the
+    estimate_soil_moisture defaults were calibrated against.
+    """
+    min_val = int(min_val)
+    span = max(1, int(max_val) - min_val)
+    levels = np.arange(256, dtype=np.int64)
+    lut = (levels - min_val) * (white_ref - black_ref) // span + black_ref
+    return np.clip(lut, black_ref, white_ref).astype(np.uint8)
+
 def load_and_preprocess_image(image_path, white_ref=255, black_ref=0):
     """
     Load an image, convert to grayscale, and apply brightness calibration.
@@ -13,40 +26,77 @@ def load_and_preprocess_image(image_path, white_ref=255, black_ref=0):
     # Convert to grayscale
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
-    # Normalize brightness using reference white and black points
+    # Normalize brightness using reference white and black points. The input is
+    # uint8, so the linear stretch is a 256-entry table applied with one cv2.LUT
     min_val, max_val, _, _ = cv2.minMaxLoc(gray)
-    normalized_gray = ((gray - min_val) / (max_val - min_val)) * (white_ref - black_ref)
     
-    return normalized_gray.astype(np.uint8)
+    return cv2.LUT(gray, calibration_lut(min_val, max_val, white_ref, black_ref))
 
-def extract_gray_level(image, roi=None):
+def extract_gray_level(image, roi=None, integral=None):
     """
     Extract average gray level from a given region of interest (ROI).
     If ROI is None, uses the entire image.
+    integral: optional cv2.integral(image), making each ROI query O(1)
+    when many ROIs are evaluated on the same image.
     """
     if roi:
         x, y, w, h = roi
+        if integral is not None:
+            total = integral[y+h, x+w] - integral[y, x+w] - integral[y+h, x] + integral[y, x]
+            return total / (w * h)
         roi_image = image[y:y+h, x:x+w]
     else:
         roi_image = image
     
-    return np.mean(roi_image)
+    return cv2.mean(roi_image)[0]
 
 def apply_brightness_calibration(image, white_ref=255, black_ref=0):
     """
     Apply brightness calibration using white and black reference points.
     """
     min_val, max_val, _, _ = cv2.minMaxLoc(image)
-    calibrated = ((image - min_val) / (max_val - min_val)) * (white_ref - black_ref)
-    return calibrated.astype(np.uint8)
+    return cv2.LUT(image, calibration_lut(min_val, max_val, white_ref, black_ref))
 
 def eliminate_gloss(image, threshold=10):
     """
     Remove gloss effects by filtering out extreme bright spots.
     """
-    mean_val = np.mean(image)
-    filtered = np.where(image > mean_val + threshold, mean_val, image)
-    return filtered.astype(np.uint8)
+    mean_val = cv2.mean(image)[0]
+    # Bright pixels are clamped to the mean; on uint8 that is a 256-entry table
+    levels = np.arange(256)
+    lut = np.where(levels > mean_val + threshold, mean_val, levels).astype(np.uint8)
+    return cv2.LUT(image, lut)
+
+def load_gloss_free_image(image_path, white_ref=255, black_ref=0, threshold=10):
+    """
+    Load, calibrate and remove gloss in a single lookup-table pass.
+    Equivalent to load_and_preprocess_image followed by eliminate_gloss.
+    The passes run on the OpenCL device (T-API) when OpenCV has one enabled.
+    """
+    # Decoded to BGR and converted, as in load_and_preprocess_image; IMREAD_GRAYSCALE
+    # would take libjpeg's luma plane, whose gray levels differ on colour JPEGs
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError("Image not found or cannot be loaded.")
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    num_pixels = gray.size
+    on_device = cv2.ocl.useOpenCL()
+    if on_device:
+        gray = cv2.UMat(gray)
+    
+    # Brightness calibration table, as in load_and_preprocess_image
+    min_val, max_val, _, _ = cv2.minMaxLoc(gray)
+    lut = calibration_lut(min_val, max_val, white_ref, black_ref)
+    
+    # Mean of the calibrated image from the raw histogram, so the calibrated
+    # image never has to be materialized before the gloss clamp
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
+    hist = (hist.get() if on_device else hist).ravel()
+    mean_val = hist @ lut / num_pixels
+    lut = np.where(lut > mean_val + threshold, mean_val, lut).astype(np.uint8)
+    
+    result = cv2.LUT(gray, lut)
+    return result.get() if on_device else result
 
 def estimate_soil_moisture(gray_level, GL_0=157, GL_s=75, u_s=50):
     """
@@ -55,12 +105,19 @@ def estimate_soil_moisture(gray_level, GL_0=157, GL_s=75, u_s=50):
     GL_s: Gray level at dry soil (0% SWC)
     u_s: Maximum SWC value (saturated soil)
     These values are all specific to the calibration process.
+    gray_level may also be an array (e.g. a whole gray image for an SWC map);
+    out-of-range values are then clipped instead of raising.
     """
-    if gray_level < GL_s or gray_level > GL_0:
-        raise ValueError("Gray level out of expected range.")
+    if np.isscalar(gray_level):
+        if gray_level < GL_s or gray_level > GL_0:
+            raise ValueError("Gray level out of expected range.")
+        return u_s - u_s * np.sqrt((gray_level - GL_s) / (GL_0 - GL_s))
     
-    swc = u_s - u_s * np.sqrt((gray_level - GL_s) / (GL_0 - GL_s))
-    return swc
+    g = np.clip(np.asarray(gray_level, dtype=np.float32), GL_s, GL_0)
+    g -= GL_s
+    g /= GL_0 - GL_s
+    np.sqrt(g, out=g)
+    return u_s - u_s * g
 
 def draw_roi(image):
     """
@@ -100,20 +157,13 @@ def process_soil_image(image_path, roi=None, max_dimension=800):
     with visualization of ROI and prediction.
     """
     try:
-        # Load and preprocess
-        image = load_and_preprocess_image(image_path)
-        
-        # Apply brightness calibration
-        calibrated_image = apply_brightness_calibration(image)
-        
-        # Remove gloss
-        gloss_removed_image = eliminate_gloss(calibrated_image)
-        
-        # Create visualization
-        display_image = cv2.cvtColor(gloss_removed_image, cv2.COLOR_GRAY2BGR)
+        # Load, calibrate and remove gloss in one pass (a second calibration
+        # after the min/max stretch is a no-op)
+        gloss_removed_image = load_gloss_free_image(image_path)
         
-        # Resize display image if too large
-        display_image = resize_to_max_dimension(display_image, max_dimension)
+        # Create visualization, resizing before expanding to three channels
+        display_gray = resize_to_max_dimension(gloss_removed_image, max_dimension)
+        display_image = cv2.cvtColor(display_gray, cv2.COLOR_GRAY2BGR)
         
         # Create window with fixed size
         cv2.namedWindow('Soil Moisture Analysis', cv2.WINDOW_AUTOSIZE)
@@ -0,0 +1,7 @@
+# Shared by the peripheral (run_peripheral.py) and the centrals
+# (run_central.py, bleak_client.py) so both sides always agree
+
+# Define UUIDs for our service and characteristic
+MOISTURE_SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
+MOISTURE_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef1"
+SERVER_NAME = "BonsaiPeripheral"
@@ -2,15 +2,12 @@ import asyncio
 import logging
 import sys
 from bleak import BleakScanner, BleakClient
+from ble_constants import MOISTURE_SERVICE_UUID, MOISTURE_CHAR_UUID, SERVER_NAME
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-MOISTURE_SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
-MOISTURE_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef1"
-SERVER_NAME = "BonsaiPeripheral"
-
 async def notification_handler(sender, data):
     """Handle incoming notifications/indications"""
     logger.info(f"Received data: {data}")
@@ -24,13 +21,17 @@ async def notification_handler(sender, data):
 async def find_ble_device():
     """Find our BLE device by name or let the user select from available devices"""
     logger.info(f"Scanning for BLE devices...")
-    devices = await BleakScanner.discover()
     
-    # Try to find by name first
-    for device in devices:
-        if device.name and SERVER_NAME in device.name:
-            logger.info(f"Found device by name: {device.name} ({device.address})")
-            return device
+    # Try to find by name first; returns as soon as the peripheral advertises
+    device = await BleakScanner.find_device_by_filter(
+        lambda device, adv: bool(device.name) and SERVER_NAME in device.name,
+        timeout=5.0,
+    )
+    if device:
+        logger.info(f"Found device by name: {device.name} ({device.address})")
+        return device
+    
+    devices = await BleakScanner.discover()
             
     # If we can't find by name, check services if available
     for device in devices:
@@ -68,17 +69,22 @@ async def connect_to_device(device):
                 logger.info(f"    Properties: {char.properties}")
         
         # Check if our service and characteristic exist
-        if MOISTURE_SERVICE_UUID.lower() not in [s.uuid.lower() for s in client.services]:
+        if client.services.get_service(MOISTURE_SERVICE_UUID) is None:
             logger.error(f"Service {MOISTURE_SERVICE_UUID} not found!")
             return
+        
+        # Resolve the characteristic once instead of a UUID lookup per operation
+        moisture_char = client.services.get_characteristic(MOISTURE_CHAR_UUID)
+        # Skip the GATT ack round-trip when the peripheral accepts unacknowledged writes
+        write_response = "write-without-response" not in moisture_char.properties
             
         try:
             # Read current value
-            value = await client.read_gatt_char(MOISTURE_CHAR_UUID)
+            value = await client.read_gatt_char(moisture_char)
             logger.info(f"Current value: {value}")
             
             # Set up notification handler for indications/notifications
-            await client.start_notify(MOISTURE_CHAR_UUID, notification_handler)
+            await client.start_notify(moisture_char, notification_handler)
             logger.info("Notifications enabled")
             
             # Interactive console for sending commands
@@ -89,20 +95,20 @@ async def connect_to_device(device):
             print("  exit - Quit the program")
             
             while True:
-                command = await asyncio.get_event_loop().run_in_executor(None, input, "\nCommand: ")
+                command = await asyncio.to_thread(input, "\nCommand: ")
                 
                 if command == "read":
-                    value = await client.read_gatt_char(MOISTURE_CHAR_UUID)
+                    value = await client.read_gatt_char(moisture_char)
                     logger.info(f"Read value: {value}")
                     
                 elif command.startswith("write "):
                     value = command[6:].encode()
-                    await client.write_gatt_char(MOISTURE_CHAR_UUID, value)
+                    await client.write_gatt_char(moisture_char, value, response=write_response)
                     logger.info(f"Wrote: {value}")
                     
                 elif command == "0xf":
                     # Special command that triggers the server's response
-                    await client.write_gatt_char(MOISTURE_CHAR_UUID, b"\x0f")
+                    await client.write_gatt_char(moisture_char, b"\x0f", response=write_response)
                     logger.info("Sent 0xF command")
                     
                 elif command == "exit":
@@ -117,7 +123,7 @@ async def connect_to_device(device):
         finally:
             # Clean up
             try:
-                await client.stop_notify(MOISTURE_CHAR_UUID)
+                await client.stop_notify(moisture_char)
                 logger.info("Notifications disabled")
             except:
                 pass
@@ -16,7 +16,11 @@ class CalibratedMoistureSensor:
         self.spi = spidev.SpiDev()
         self.spi.open(0, 0)
         self.spi.max_speed_hz = 1000000
+        self.spi.mode = 0
+        self.spi.bits_per_word = 8
         self.channel = channel
+        # MCP3008 single-ended read command for this channel, built once
+        self._request = [1, (8 + channel) << 4, 0]
         
         # Default calibration based on provided measurements
         self.calibration_points = calibration_points or [(0,0), (84, 5), (286, 10), (495, 15), (650, 20)]
@@ -28,12 +32,18 @@ class CalibratedMoistureSensor:
         # Linear regression: y = mx + b
         self.slope, self.intercept = np.polyfit(x, y, 1)
         print(f"Calibration line: y = {self.slope:.6f}x + {self.intercept:.6f}")
+        
+        # The MCP3008 is 10-bit, so every possible reading is calibrated up front
+        self._lut = np.maximum(0, self.slope * np.arange(1024) + self.intercept).tolist()
+        
+        # Same line pre-scaled to percent of saturation (20%) for read_calibrated_percent
+        self._slope_pct = self.slope * (100.0 / 20.0)
+        self._intercept_pct = self.intercept * (100.0 / 20.0)
     
     def read_raw(self):
         """Read raw value from the MCP3008 chip."""
-        adc = self.spi.xfer2([1, (8 + self.channel) << 4, 0])
-        data = ((adc[1] & 3) << 8) + adc[2]
-        return data
+        adc = self.spi.xfer2(self._request)
+        return ((adc[1] & 3) << 8) | adc[2]
     
     def read_percent(self):
         """Convert raw value to percentage (0-100%)."""
@@ -53,21 +63,24 @@ class CalibratedMoistureSensor:
         This is useful for displaying the value as a percentage.
         The max value is assumed to be 100% water content.
         """
-        raw_value = self.read_raw()
-        abs_percent = self.calibrate(raw_value)
-        rel_percent = abs_percent / 20.0 # 20% is the saturation percentage
-        return int(round(rel_percent * 100))
+        return self.calibrate_percent(self.read_raw())
+    
+    def calibrate_percent(self, raw_value) -> int:
+        """Convert a raw sensor value to the percentage returned by read_calibrated_percent."""
+        rel_percent = self._slope_pct * raw_value + self._intercept_pct
+        return 0 if rel_percent < 0 else int(rel_percent + 0.5)
     
     def calibrate(self, raw_value):
         """Convert raw sensor value to calibrated water content percentage.
         
-        Uses the fitted line equation: water_content = slope * raw_value + intercept
+        Uses the fitted line equation: water_content = slope * raw_value + intercept,
+        clipped at zero (sensors can't report negative water content). 10-bit ADC
+        readings are looked up in the table built in __init__; any other value
+        (floats, out-of-range or negative ints) is computed from the line.
         """
-        # Calculate water content using the fitted line
-        water_content = self.slope * raw_value + self.intercept
-        
-        # Ensure output is non-negative (sensors can't report negative water content)
-        return max(0, water_content)
+        if isinstance(raw_value, int) and 0 <= raw_value < 1024:
+            return self._lut[raw_value]
+        return max(0.0, self.slope * raw_value + self.intercept)
     
     def close(self):
         """Close SPI connection."""
@@ -1,22 +1,45 @@
 import RPi.GPIO as GPIO
 import Adafruit_DHT 	
 import time
+import asyncio
+import queue
+import threading
 import spidev
+import numpy as np
 
 # Open SPI bus
 spi = spidev.SpiDev()
 spi.open(0,0)
 spi.max_speed_hz=1000000
+spi.mode=0
+spi.bits_per_word=8
+
+# MCP3008 single-ended read commands, one per channel, built once
+commands = [[1,(8+channel)<<4,0] for channel in range(8)]
 
 # Function to read SPI data from MCP3008 chip
 # Channel must be an integer 0-7
 def ReadChannel(channel):
-    adc = spi.xfer2([1,(8+channel)<<4,0])
-    data = ((adc[1]&3) << 8) + adc[2]
+    adc = spi.xfer2(commands[channel])
+    data = ((adc[1]&3) << 8) | adc[2]
     return data
 
+# Read n samples of a channel back to back.
+# Each conversion needs its own chip-select cycle on the MCP3008 (with CS held low it
+# only shifts out the previous result), so this is n short transfers with no sleep
+# in between rather than one long one.
+def ReadChannelBatch(channel, n):
+    xfer2 = spi.xfer2
+    command = commands[channel]
+    samples = []
+    for _ in range(n):
+        adc = xfer2(command)
+        samples.append(((adc[1]&3) << 8) | adc[2])
+    return samples
+
+# data/10.24 rounded half up, in integer arithmetic (data is 10-bit)
 def ConverttoPercent(data):
-    percent = int(round(data/10.24))
+    percent = (data*100 + 512) >> 10
     return percent
 
 # Define sensor channel (on MCP3008)
@@ -25,34 +48,127 @@ moisture_channel  = 0
 # Define delay between readings
 delay = 2
 
-# Open a file to record data
-output_file = "moisture.txt"  # Replace with your desired file path
-with open(output_file, "w") as file:
-    file.write("Time(s),Moisture(%)\n")  # Write header
+# Samples averaged into each recorded reading; the loop still wakes once per delay
+samples_per_reading = 8
 
-    start_time = time.time()
+# Show a live plot of the readings (needs a display and matplotlib)
+live_plot = False
+
+# Number of most recent readings kept in the live plot
+plot_window = 300
+
+if live_plot:
+    import matplotlib.pyplot as plt
+    plt.ion()
+    fig, ax = plt.subplots()
+    line, = ax.plot([], [], animated=True)
+    ax.set_xlabel("Time (s)")
+    ax.set_ylabel("Moisture (%)")
+    window_span = plot_window * delay
+    ax.set_xlim(0, window_span)
+    ax.set_ylim(0, 100)
+    plt.show(block=False)
+    # Render the static parts once; each sample only redraws the line on top
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(ax.bbox)
+    # Ring buffers stored twice over, so the last plot_window readings are always
+    # one contiguous, chronological slice (no allocation or reordering per sample)
+    time_data = np.empty(2 * plot_window, dtype=np.float32)
+    moisture_data = np.empty(2 * plot_window, dtype=np.float32)
+    sample_count = 0
+
+# Seconds between flushes of the buffered output file
+flush_interval = 5
+
+# Records for the writer thread, so a slow disk or console never delays sampling
+log_queue = queue.Queue(maxsize=4096)
+
+# Write queued (line, message) records to the file and stdout until a None arrives
+def LogWriter(file):
+    last_flush = time.time()
+    while True:
+        record = log_queue.get()
+        if record is None:
+            break
+        line, message = record
+        file.write(line)
+        print(message)
+        if time.time() - last_flush >= flush_interval:
+            file.flush()
+            last_flush = time.time()
+    file.flush()
 
+# Queue a record without blocking; if the writer has fallen behind, drop the oldest
+def LogRecord(line, message):
     try:
-        while True:
-            # Read the moisture sensor data
-            moisture_level = ReadChannel(moisture_channel)
-            moisture_percent = ConverttoPercent(moisture_level)
+        log_queue.put_nowait((line, message))
+    except queue.Full:
+        try:
+            log_queue.get_nowait()
+        except queue.Empty:
+            pass
+        log_queue.put_nowait((line, message))
 
-            # Calculate elapsed time
-            elapsed_time = time.time() - start_time
+# Sample every delay seconds against a monotonic deadline, so the time spent
+# reading, logging and plotting doesn't accumulate as drift. Runs as an asyncio
+# task, so other coroutines (e.g. a BLE loop) can share the process between samples.
+async def SampleLoop(start_time):
+    global sample_count, background
+    next_tick = time.monotonic()
+    while True:
+        # Read the moisture sensor data
+        samples = ReadChannelBatch(moisture_channel, samples_per_reading)
+        moisture_level = (sum(samples) + samples_per_reading // 2) // samples_per_reading
+        moisture_percent = ConverttoPercent(moisture_level)
 
-            # Write data to file
-            file.write(f"{elapsed_time:.2f},{moisture_percent}\n")
-            file.flush()  # Ensure data is written to disk
+        # Calculate elapsed time
+        elapsed_time = time.time() - start_time
 
-            # Print out results
-            print("--------------------------------------------")
-            print("Moisture : {} ({}%)".format(moisture_level, moisture_percent))  
+        # Hand the file line and printout to the writer thread
+        LogRecord(f"{elapsed_time:.2f},{moisture_percent}\n",
+                  "--------------------------------------------\n"
+                  "Moisture : {} ({}%)".format(moisture_level, moisture_percent))
 
-            # Wait before repeating loop
-            time.sleep(delay)
+        if live_plot:
+            slot = sample_count % plot_window
+            time_data[slot] = time_data[slot + plot_window] = elapsed_time
+            moisture_data[slot] = moisture_data[slot + plot_window] = moisture_percent
+            sample_count += 1
+            if sample_count < plot_window:
+                view = slice(0, sample_count)
+            else:
+                view = slice(slot + 1, slot + 1 + plot_window)
+            line.set_data(time_data[view], moisture_data[view])
+            if elapsed_time > ax.get_xlim()[1]:
+                # Full redraw only when the time axis has to move, once per window
+                ax.set_xlim(elapsed_time - window_span, elapsed_time + window_span)
+                fig.canvas.draw()
+                background = fig.canvas.copy_from_bbox(ax.bbox)
+            fig.canvas.restore_region(background)
+            ax.draw_artist(line)
+            fig.canvas.blit(ax.bbox)
+            fig.canvas.flush_events()
+
+        # Wait until the next sample is due
+        next_tick += delay
+        await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+
+# Open a file to record data
+output_file = "moisture.txt"  # Replace with your desired file path
+with open(output_file, "w", buffering=8192) as file:
+    file.write("Time(s),Moisture(%)\n")  # Write header
+
+    writer = threading.Thread(target=LogWriter, args=(file,), daemon=True)
+    writer.start()
+
+    start_time = time.time()
+
+    try:
+        asyncio.run(SampleLoop(start_time))
     except KeyboardInterrupt:
         print("Program stopped by user")
     finally:
-        # Cleanup GPIO settings
+        # Let the writer drain and flush the tail, then cleanup GPIO settings
+        log_queue.put(None)
+        writer.join(timeout=5)
         spi.close()
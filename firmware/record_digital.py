@@ -1,16 +1,48 @@
 import RPi.GPIO as GPIO
-import time
+import mmap
+import os
+import signal
+import struct
+
+# GPIO pin level register for pins 0-31 on the BCM2835/2836/2837/2711 (Pi 1-4)
+GPLEV0_OFFSET = 0x34
+GPLEV0 = struct.Struct("<I")
+
+def map_gpio_registers():
+    """
+    Map /dev/gpiomem read-only so pin levels can be read with one register load.
+    Returns None where the register layout differs (Pi 5 / RP1) or the device
+    is unavailable, in which case readings go through RPi.GPIO.
+    """
+    try:
+        with open("/proc/device-tree/compatible", "rb") as f:
+            compatible = f.read()
+        if not any(soc in compatible for soc in (b"bcm2835", b"bcm2836", b"bcm2837", b"bcm2711")):
+            return None
+        fd = os.open("/dev/gpiomem", os.O_RDONLY | os.O_SYNC)
+        try:
+            return mmap.mmap(fd, 4096, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+    except OSError:
+        return None
 
 class MoistureSensor:
 
-    def __init__(self, channel):
+    def __init__(self, channel, verbose=False):
         GPIO.setmode(GPIO.BCM)
         self.channel = channel
+        self.verbose = verbose
         GPIO.setup(self.channel, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.registers = map_gpio_registers() if channel < 32 else None
 
     def get_reading(self) -> int:
-        input_value = GPIO.input(self.channel)
-        print(f"GPIO Pin {self.channel} value: {input_value}")
+        if self.registers is not None:
+            input_value = (GPLEV0.unpack_from(self.registers, GPLEV0_OFFSET)[0] >> self.channel) & 1
+        else:
+            input_value = GPIO.input(self.channel)
+        if self.verbose:
+            print(f"GPIO Pin {self.channel} value: {input_value}")
         return input_value
 
     def __del__(self):
@@ -21,10 +53,13 @@ if __name__ == "__main__":
     sensor = MoistureSensor(21)
 
     try: 
-        while True:
-            val = sensor.get_reading()
-            print(val)
-            time.sleep(1)
+        print(sensor.get_reading())
+        # Print on each level change instead of polling; the callback runs on
+        # the RPi.GPIO thread while the main thread sleeps until a signal
+        GPIO.add_event_detect(sensor.channel, GPIO.BOTH,
+                              callback=lambda channel: print(sensor.get_reading()),
+                              bouncetime=200)
+        signal.pause()
 
     except KeyboardInterrupt:
         print("Program terminated")
@@ -1,43 +1,48 @@
 import asyncio
+import logging
 import random
 import sys
 import platform
 import subprocess
 from record_digital import MoistureSensor
-from bleak import BleakScanner, BleakClient
+from bleak import BleakScanner
 from bleak.exc import BleakError
+from bleak_retry_connector import BleakClientWithServiceCache, establish_connection
+# UUIDs and advertised name - shared with the peripheral and your phone app
+from ble_constants import MOISTURE_SERVICE_UUID, MOISTURE_CHAR_UUID
+from ble_constants import SERVER_NAME as PHONE_APP_NAME
 
-# Define UUIDs - these should match the UUIDs used in your phone app
-MOISTURE_SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
-MOISTURE_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef1"
-PHONE_APP_NAME = "BonsaiPeripheral"
+# Configure logging; set DEBUG to dump the discovered GATT table on every connection
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-# Function to generate mock moisture data
-def get_moisture_data(sensor: MoistureSensor):
+format_moisture = "Moisture: {}%".format
+
+# Function to generate mock moisture data, as the message text
+def get_moisture_data(sensor: MoistureSensor) -> str:
     reading = sensor.get_reading()
     # reading is either 1 or 0
     if reading == 0:
         moisture_level = random.randint(0, 20)
     else:
         moisture_level = random.randint(70, 100)
-    return f"Moisture: {moisture_level}%".encode('utf-8')
+    return format_moisture(moisture_level)
 
-async def retry_connect(address, max_attempts=3, delay=2.0):
-    """Attempt to connect with retries"""
-    for attempt in range(max_attempts):
-        try:
-            print(f"Connection attempt {attempt+1}/{max_attempts}...")
-            client = BleakClient(address)
-            await client.connect(timeout=15.0, force_pairing=False)
-            if client.is_connected:
-                print("✅ Connected successfully!")
-                return client
-            print("Failed to connect, retrying...")
-        except BleakError as e:
-            print(f"Connection error: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-        await asyncio.sleep(delay)
+async def connect(device, max_attempts=3):
+    """
+    Connect with backoff retries; GATT services are cached across reconnects,
+    so only the first connection pays for a full service discovery.
+    """
+    try:
+        client = await establish_connection(
+            BleakClientWithServiceCache, device, PHONE_APP_NAME, max_attempts=max_attempts
+        )
+        print("✅ Connected successfully!")
+        return client
+    except BleakError as e:
+        print(f"Connection error: {e}")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
     return None
 
 async def forget_and_retry(address):
@@ -60,63 +65,56 @@ async def scan_and_connect(sensor: MoistureSensor):
     print(f"Service UUID: {MOISTURE_SERVICE_UUID}")
     print(f"Characteristic UUID: {MOISTURE_CHAR_UUID}")
 
+    # The device found by the last scan; kept so a dropped connection reconnects
+    # directly instead of scanning again
+    phone_device = None
+
     while True:
         try:
-            print("\n--------- New Scan Cycle ---------")
-            devices = await BleakScanner.discover(timeout=10.0)
-            print(f"Found {len(devices)} devices")
-
-            phone_device = next((device for device in devices if device.name and PHONE_APP_NAME in device.name), None)
+            if phone_device is None:
+                print("\n--------- New Scan Cycle ---------")
+                # Stops scanning at the first matching advertisement instead of always waiting out the timeout
+                phone_device = await BleakScanner.find_device_by_filter(
+                    lambda device, adv: bool(device.name) and PHONE_APP_NAME in device.name,
+                    timeout=10.0,
+                )
+                if phone_device:
+                    print(f"✅ Found target device: {phone_device.name} ({phone_device.address})")
 
             if phone_device:
-                print(f"✅ Found target device: {phone_device.name} ({phone_device.address})")
-                client = await retry_connect(phone_device.address)
+                client = await connect(phone_device)
 
                 if client and client.is_connected:
                     try:
-                        print("Connected! Discovering services...")
-                        await asyncio.sleep(2.0)
-                        services = None
-                        for retry in range(3):
-                            try:
-                                services = await client.get_services()
-                                break
-                            except Exception as e:
-                                print(f"Service discovery error (attempt {retry+1}/3): {e}")
-                                await asyncio.sleep(1.0)
-                        if not services:
-                            print("⚠️ Failed all service discovery attempts.")
-                            await client.disconnect()
-
-                            if await forget_and_retry(phone_device.address):
-                                continue # retry the whole loop after forgetting.
-
-                            await asyncio.sleep(5.0)
-                            continue
-
-                        service_list = list(services)
-                        print("\n--- DISCOVERED SERVICES AND CHARACTERISTICS ---")
-                        for service in service_list:
-                            print(f"Service: {service.uuid}")
-                            for char in service.characteristics:
-                                props = ", ".join(char.properties)
-                                print(f"  Characteristic: {char.uuid}\n    Properties: {props}\n    Handle: {char.handle}")
-                        print("---------------------------------------------\n")
-
-                        target_service = next((s for s in service_list if s.uuid.lower() == MOISTURE_SERVICE_UUID.lower()), None)
+                        # Services are resolved (or taken from the cache) by establish_connection
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("--- DISCOVERED SERVICES AND CHARACTERISTICS ---")
+                            for service in client.services:
+                                logger.debug("Service: %s", service.uuid)
+                                for char in service.characteristics:
+                                    props = ", ".join(char.properties)
+                                    logger.debug("  Characteristic: %s\n    Properties: %s\n    Handle: %s",
+                                                 char.uuid, props, char.handle)
+
+                        # bleak normalizes the UUIDs, so no per-entry lowercasing here
+                        target_service = client.services.get_service(MOISTURE_SERVICE_UUID)
                         if not target_service:
                             print(f"⚠️ Target service ({MOISTURE_SERVICE_UUID}) not found!")
+                            await client.clear_cache()
                             await client.disconnect()
-                            if await forget_and_retry(phone_device.address):
+                            address, phone_device = phone_device.address, None
+                            if await forget_and_retry(address):
                                 continue
                             await asyncio.sleep(5.0)
                             continue
 
-                        target_char = next((char for char in target_service.characteristics if char.uuid.lower() == MOISTURE_CHAR_UUID.lower()), None)
+                        target_char = target_service.get_characteristic(MOISTURE_CHAR_UUID)
                         if not target_char:
                             print(f"⚠️ Target characteristic ({MOISTURE_CHAR_UUID}) not found!")
+                            await client.clear_cache()
                             await client.disconnect()
-                            if await forget_and_retry(phone_device.address):
+                            address, phone_device = phone_device.address, None
+                            if await forget_and_retry(address):
                                 continue
                             await asyncio.sleep(5.0)
                             continue
@@ -124,7 +122,7 @@ async def scan_and_connect(sensor: MoistureSensor):
                         print("✅ Service and characteristic found!")
                         if "read" in target_char.properties:
                             try:
-                                read_value = await client.read_gatt_char(target_char.uuid)
+                                read_value = await client.read_gatt_char(target_char)
                                 print(f"Initial read value: {read_value}")
                                 try:
                                     print(f"Decoded: {read_value.decode('utf-8')}")
@@ -133,25 +131,26 @@ async def scan_and_connect(sensor: MoistureSensor):
                             except Exception as e:
                                 print(f"Failed to read characteristic: {e}")
 
+                        # Skip the ATT acknowledgement when the peripheral accepts unacknowledged writes
+                        write_response = "write-without-response" not in target_char.properties
+
+                        # Stay connected for as long as the link holds; only a drop or an
+                        # error leads back to the (scan-free) reconnect below
                         print("\nStarting communication loop...")
-                        for i in range(10):
+                        while client.is_connected:
                             try:
-                                if client.is_connected:
-                                    data = get_moisture_data(sensor)
-                                    print(f"Sending: {data.decode('utf-8')}")
-                                    await client.write_gatt_char(target_char.uuid, data)
-                                    print("✅ Write successful")
-                                    await asyncio.sleep(5.0)
-                                else:
-                                    print("Connection lost")
-                                    break
+                                message = get_moisture_data(sensor)
+                                print(f"Sending: {message}")
+                                await client.write_gatt_char(target_char, message.encode('utf-8'), response=write_response)
+                                print("✅ Write successful")
+                                await asyncio.sleep(5.0)
                             except Exception as e:
                                 print(f"Error in communication loop: {e}")
                                 break
 
-                        print("Communication complete, disconnecting...")
-                        await client.disconnect()
-                        print("Disconnected cleanly")
+                        print("Connection lost, reconnecting...")
+                        if client.is_connected:
+                            await client.disconnect()
 
                     except Exception as e:
                         print(f"Error during device interaction: {e}")
@@ -160,7 +159,8 @@ async def scan_and_connect(sensor: MoistureSensor):
                         if client.is_connected:
                             await client.disconnect()
                 else:
-                    print("Could not establish connection to device")
+                    print("Could not establish connection to device, will scan again")
+                    phone_device = None
             else:
                 print(f"Device '{PHONE_APP_NAME}' not found, will scan again")
             await asyncio.sleep(5.0)
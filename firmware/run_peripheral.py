@@ -1,12 +1,8 @@
-import sys
 import logging
 import asyncio
-import threading
 import time
-import spidev
-import numpy as np
 
-from typing import Any, Union
+from typing import Any, Optional
 
 from bless import (  # type: ignore
     BlessServer,
@@ -17,47 +13,33 @@ from bless import (  # type: ignore
 
 # Import the CalibratedMoistureSensor class
 from calibrated_sensor import CalibratedMoistureSensor
+# UUIDs for our service and characteristic
+from ble_constants import MOISTURE_SERVICE_UUID, MOISTURE_CHAR_UUID, SERVER_NAME
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(name=__name__)
 
-# Define UUIDs for our service and characteristic
-MOISTURE_SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
-MOISTURE_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef1"
-SERVER_NAME = "BonsaiPeripheral"
-
-# NOTE: Some systems require different synchronization methods.
-trigger: Union[asyncio.Event, threading.Event]
-if sys.platform in ["darwin", "win32"]:
-    trigger = threading.Event()
-else:
-    trigger = asyncio.Event()
+# Set to stop the server. Created inside run() so it belongs to the running event
+# loop; bless may call write_request from its own thread (darwin/win32), so it is
+# set through event_loop.call_soon_threadsafe.
+trigger: Optional[asyncio.Event] = None
+event_loop: Optional[asyncio.AbstractEventLoop] = None
 
 # Global sensor instance
 moisture_sensor = None
 
+# Encoded characteristic payload for each percent reading, built on first use
+percent_payloads = {}
+
 def read_request(characteristic: BlessGATTCharacteristic, **kwargs) -> bytearray:
     """
     Handle read requests from clients
-    The client must send a read request every time it wants to read the moisture value.
-    NOTE: Alternatively, we repeatedly read automatically, set the characterstic.value
-    every few seconds, and notify the client by server.update_value(my_service_uuid, my_char_uuid)
+    Reads return the value last published by update_moisture_readings, which is
+    the only place the sensor is read, so SPI traffic stays at the update
+    interval however often clients poll.
     """
-    logger.debug(f"Reading {characteristic.value}")
-    
-    # If this is a read from the moisture characteristic, get fresh data
-    if characteristic.uuid == MOISTURE_CHAR_UUID:
-        try:
-            # Get current moisture reading
-            if moisture_sensor:
-                moisture_value = moisture_sensor.read_calibrated_percent()
-                # Convert float to string and then to bytearray
-                characteristic.value = bytearray(f"{moisture_value}".encode())
-                logger.info(f"Sending moisture value: {moisture_value}%")
-        except Exception as e:
-            logger.error(f"Error reading moisture sensor: {e}")
-    
+    logger.debug("Reading %s", characteristic.value)
     return characteristic.value
 
 
@@ -65,50 +47,75 @@ def write_request(characteristic: BlessGATTCharacteristic, value: Any, **kwargs)
     """
     Handle write requests from clients
     NOTE: Obviously the client cannot write to the sensor lol
+    The write is not stored in characteristic.value: that holds the payload
+    published by update_moisture_readings, which reads return.
     """
-    characteristic.value = value
-    logger.debug(f"Char value set to {characteristic.value}")
+    logger.debug("Client wrote %s", value)
     
     # Special command handling
-    if characteristic.value == b"\x0f":
+    # Single-byte command, checked without building a bytes literal to compare
+    if len(value) == 1 and value[0] == 0x0F:
         logger.debug("Received special command (0x0F)")
-        trigger.set()
+        event_loop.call_soon_threadsafe(trigger.set)
 
 
 async def update_moisture_readings(server: BlessServer,
                                    service_uuid: str,
                                    characteristic: BlessGATTCharacteristic,
                                    char_uuid: str,
-                                   interval: int =5.0):
+                                   interval: int =5.0,
+                                   min_change: int = 1,
+                                   heartbeat: float = 60.0):
     """
     Periodically update moisture readings and notify clients
+    A notification is only sent when the value moved by at least min_change since
+    the last one, or heartbeat seconds have passed, to save radio air-time.
     """
+    last_notified = None
+    last_notify_time = 0.0
+    # Ticks are scheduled on fixed deadlines so the time spent reading and
+    # notifying does not stretch the period
+    loop = asyncio.get_running_loop()
+    next_deadline = loop.time()
     try:
         while True:
             if moisture_sensor:
                 try:
                     # Read moisture value
-                    moisture_value = moisture_sensor.read_calibrated()
-                    
-                    # Format as string with 2 decimal places
-                    moisture_str = f"{moisture_value:.2f}"
-                    logger.info(f"Current moisture: {moisture_str}%")
-                    
-                    # Update characteristic value
-                    characteristic.value = bytearray(moisture_str.encode())
-                    server.update_value(service_uuid, char_uuid)
+                    moisture_value = moisture_sensor.read_calibrated_percent()
+                    now = time.monotonic()
+                    if (last_notified is None
+                            or abs(moisture_value - last_notified) >= min_change
+                            or now - last_notify_time >= heartbeat):
+                        payload = percent_payloads.get(moisture_value)
+                        if payload is None:
+                            payload = percent_payloads[moisture_value] = bytearray(b"%d" % moisture_value)
+                        logger.info("Current moisture: %s%%", moisture_value)
+                        
+                        # Update characteristic value
+                        characteristic.value = payload
+                        server.update_value(service_uuid, char_uuid)
+                        last_notified = moisture_value
+                        last_notify_time = now
                     
                 except Exception as e:
-                    logger.error(f"Error updating moisture value: {e}")
+                    logger.error("Error updating moisture value: %s", e)
             
-            # Wait before next update
-            await asyncio.sleep(interval)
+            # Wait for the next deadline; if we fell more than an interval
+            # behind, skip forward instead of running the missed ticks back to back
+            next_deadline += interval
+            now = loop.time()
+            if now - next_deadline > interval:
+                next_deadline = now + interval
+            await asyncio.sleep(max(0.0, next_deadline - now))
     except asyncio.CancelledError:
         logger.info("Moisture update task cancelled")
 
 
-async def run(loop):
-    global moisture_sensor
+async def run():
+    global moisture_sensor, event_loop, trigger
+    loop = event_loop = asyncio.get_running_loop()
+    trigger = asyncio.Event()
     
     # Initialize the moisture sensor
     try:
@@ -118,9 +125,6 @@ async def run(loop):
         logger.error(f"Failed to initialize moisture sensor: {e}")
         moisture_sensor = None
     
-    # Clear any previous triggers
-    trigger.clear()
-    
     # Instantiate the BLE server
     server = BlessServer(name=SERVER_NAME, loop=loop)
     server.read_request_func = read_request
@@ -146,7 +150,9 @@ async def run(loop):
         permissions
     )
 
-    logger.debug(f"Created characteristic: {server.get_characteristic(MOISTURE_CHAR_UUID)}")
+    # Looked up once; update_moisture_readings takes this object directly
+    moisture_char = server.get_characteristic(MOISTURE_CHAR_UUID)
+    logger.debug("Created characteristic: %s", moisture_char)
     
     # Start the server
     await server.start()
@@ -154,22 +160,23 @@ async def run(loop):
     logger.info(f"Service UUID: {MOISTURE_SERVICE_UUID}")
     logger.info(f"Characteristic UUID: {MOISTURE_CHAR_UUID}")
     
+    # Publish readings for reads and notifications
+    update_task = asyncio.create_task(update_moisture_readings(
+        server, MOISTURE_SERVICE_UUID, moisture_char, MOISTURE_CHAR_UUID))
+    
     try:
         # Run until triggered to stop
-        if trigger.__module__ == "threading":
-            trigger.wait()
-        else:
-            await trigger.wait()
+        await trigger.wait()
     
         await asyncio.sleep(2)
         logger.info("Updating...")
-        server.get_characteristic(MOISTURE_CHAR_UUID)
         server.update_value(MOISTURE_SERVICE_UUID, MOISTURE_CHAR_UUID)
         await asyncio.sleep(2)
         
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received")
     finally:
+        update_task.cancel()
         if moisture_sensor:
             try:
                 moisture_sensor.close()
@@ -182,10 +189,14 @@ async def run(loop):
 
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
+    # Use the libuv-backed loop where it is installed (Linux); otherwise the default
     try:
-        loop.run_until_complete(run(loop))
+        import uvloop
+        run_loop = uvloop.run
+    except ImportError:
+        run_loop = asyncio.run
+
+    try:
+        run_loop(run())
     except KeyboardInterrupt:
         logger.info("Program stopped by user")
-    finally:
-        loop.close()
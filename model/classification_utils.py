@@ -3,6 +3,10 @@ Classification utilities for soil moisture prediction using image data.
 The main functions exported are 
     - `load_data`
     - `prepare_features`
+    - `load_or_compute_features`
+    - `zscore_inplace` / `minmax_inplace`
+    - `loo_minmax_bounds` / `neighbor_weights`
+    - `class_centroids`
     - `perform_evaluation`
     - `save_model`
     - `perform_inference`
@@ -18,7 +22,10 @@ import os
 import matplotlib.pyplot as plt
 from sklearn.metrics import confusion_matrix, classification_report
 import joblib
-from typing import Tuple, List, Dict, Any
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Tuple, List, Dict, Any, Optional
 
 # Constants
 ROI_SIZE: Tuple[int, int] = (512, 512)
@@ -26,6 +33,9 @@ AUGMENTATION_PARAMS: Dict[str, List[int]] = {
     'brightness': [-10, 10],
     'rotation': [-5, 5],
 }
+# Bump whenever extract_features changes what it computes, so cached matrices
+# from load_or_compute_features are rebuilt instead of served stale
+FEATURE_VERSION = 1
 FEATURE_NAMES = [
     'mean_R', 'mean_G', 'mean_B',
     'std_R', 'std_G', 'std_B',
@@ -44,7 +54,9 @@ def load_data(csv_path: str, image_dir: str) -> Tuple[pd.DataFrame, str]:
 def normalize_lighting(img: np.ndarray) -> np.ndarray:
     """Normalize lighting in the image using LAB color space."""
     img_lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    img_lab[:, :, 0] = 128  # Fix brightness
+    # Fix brightness; mixChannels fills L in one pass, where the strided numpy
+    # assignment cost almost as much as a colour conversion
+    cv2.mixChannels([np.full(img.shape[:2], 128, np.uint8)], [img_lab], [0, 0])
     return cv2.cvtColor(img_lab, cv2.COLOR_LAB2BGR)
 
 def get_center_roi(img: np.ndarray, roi_size: Tuple[int, int]) -> np.ndarray:
@@ -68,27 +80,47 @@ def get_center_roi(img: np.ndarray, roi_size: Tuple[int, int]) -> np.ndarray:
 
     return img[start_y:end_y, start_x:end_x]
 
-def augment_image(img: np.ndarray) -> List[np.ndarray]:
+@lru_cache(maxsize=128)
+def load_roi(image_path: str) -> np.ndarray:
+    """
+    Decode an image and crop its centered ROI. Cached per path, so extracting features
+    again for the same image (other flags, repeated runs in one session) skips imread.
+    The returned array is shared between calls and therefore read-only.
+    """
+    img = cv2.imread(image_path)
+    if img is None:
+        raise FileNotFoundError(f"Image not found: {image_path}")
+    # Copied so the cache holds just the ROI, not the whole decoded image
+    roi = get_center_roi(img, ROI_SIZE).copy()
+    roi.flags.writeable = False
+    return roi
+
+def augment_image(img: np.ndarray, brightness: Optional[int] = None, angle: Optional[float] = None) -> List[np.ndarray]:
     """
     Apply random augmentation to image.
     Produces 3 images: 
     1. Original
     2. Brightness adjusted
     3. Rotated
+    The brightness delta and rotation angle are drawn from AUGMENTATION_PARAMS
+    when not given.
     """
     augmented = []
     h, w = img.shape[:2]
     
-    # Original image
-    augmented.append(img.copy())
+    # Original image (only read downstream, so not copied)
+    augmented.append(img)
     
-    # Brightness adjustment
-    bright = img.copy()
-    bright = cv2.add(bright, np.random.randint(*AUGMENTATION_PARAMS['brightness']))
+    # Brightness adjustment; cv2.add writes a new image
+    if brightness is None:
+        brightness = np.random.randint(*AUGMENTATION_PARAMS['brightness'])
+    bright = cv2.add(img, int(brightness))
     augmented.append(bright)
     
     # Rotation
-    angle = np.random.uniform(*AUGMENTATION_PARAMS['rotation'])
+    if angle is None:
+        angle = np.random.uniform(*AUGMENTATION_PARAMS['rotation'])
+    angle = float(angle)
     matrix = cv2.getRotationMatrix2D((w/2, h/2), angle, 1.0)
     rotated = cv2.warpAffine(img, matrix, (w, h))
     augmented.append(rotated)
@@ -102,8 +134,9 @@ def entropy(img: np.ndarray) -> float:
     return -np.sum(hist * np.log2(hist + 1e-7))
 
 def extract_features(image_path: str, normalize: bool = True, 
-                     augment: bool = False) -> List[List[float]]:
+                     augment: bool = False, aug_params: Optional[Tuple[int, float]] = None) -> List[np.ndarray]:
     """Extract features from a single image.
+    aug_params is an optional (brightness, angle) pair passed to `augment_image`.
     
     Returns:
         List of feature vectors, where each vector contains the following features in order:
@@ -116,61 +149,165 @@ def extract_features(image_path: str, normalize: bool = True,
         - Entropy (1)
         Total: 19 features
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        raise FileNotFoundError(f"Image not found: {image_path}")
-    
-    img = get_center_roi(img, ROI_SIZE)
+    img = load_roi(image_path)
     if normalize:
         img = normalize_lighting(img)
     
     features_list = []
-    images_to_process = augment_image(img) if augment else [img]
+    images_to_process = augment_image(img, *(aug_params or ())) if augment else [img]
     
     for processed_img in images_to_process:
-        img_rgb = cv2.cvtColor(processed_img, cv2.COLOR_BGR2RGB)
         img_hsv = cv2.cvtColor(processed_img, cv2.COLOR_BGR2HSV)
         img_lab = cv2.cvtColor(processed_img, cv2.COLOR_BGR2LAB)
         
-        # Initialize feature vector with fixed order
-        features = []
+        # Feature vector in FEATURE_NAMES order, filled in place
+        features = np.empty(len(FEATURE_NAMES), dtype=np.float32)
         
-        # RGB features
-        for i in range(3):
-            features.append(np.mean(img_rgb[:,:,i]))  # RGB means
-        for i in range(3):
-            features.append(np.std(img_rgb[:,:,i]))   # RGB std devs
-        for i in range(3):
-            features.append(np.var(img_rgb[:,:,i]))   # RGB variances
+        # RGB features: means, std devs and variances from one pass
+        # Taken on the BGR image and reversed, instead of converting to RGB
+        mean, std = cv2.meanStdDev(processed_img)
+        mean, std = mean[::-1], std[::-1]
+        features[0:3] = mean.ravel()
+        features[3:6] = std.ravel()
+        features[6:9] = std.ravel() ** 2
             
         # HSV features
-        for i in range(3):
-            features.append(np.mean(img_hsv[:,:,i]))  # HSV means
-        for i in range(3):
-            features.append(np.std(img_hsv[:,:,i]))   # HSV std devs
+        mean, std = cv2.meanStdDev(img_hsv)
+        features[9:12] = mean.ravel()
+        features[12:15] = std.ravel()
             
         # LAB features
-        for i in range(3):
-            features.append(np.mean(img_lab[:,:,i]))  # LAB means
+        features[15:18] = cv2.mean(img_lab)[:3]
             
         # Texture features
         gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-        features.append(entropy(gray))
+        features[18] = entropy(gray)
         
         features_list.append(features)
     
     return features_list
 
 def prepare_features(df: pd.DataFrame, image_dir: str,
-                     normalize: bool = True, augment: bool = False) -> Tuple[np.ndarray, np.ndarray]:
-    """Prepare features and labels from the dataset."""
-    X, y = [], []
-    for _, row in df.iterrows():
-        img_path = os.path.join(image_dir, row["Image"])
-        features_list = extract_features(img_path, normalize, augment)
-        X.extend(features_list)
-        y.extend([row["Class"]] * len(features_list))
-    return np.array(X), np.array(y)
+                     normalize: bool = True, augment: bool = False,
+                     seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Prepare features and labels from the dataset.
+    Images are processed on a thread pool (OpenCV releases the GIL) and each one's
+    rows are written straight into the preallocated feature matrix. Augmentation
+    parameters for every image are drawn up front from `np.random.default_rng(seed)`,
+    so a fixed seed reproduces the same rows.
+    """
+    n_aug = 3 if augment else 1
+    # float32 halves the bytes sklearn's BLAS kernels stream for LDA/PCA/SVM fits
+    X = np.empty((len(df) * n_aug, len(FEATURE_NAMES)), dtype=np.float32)
+    img_paths = [os.path.join(image_dir, image) for image in df["Image"]]
+    rng = np.random.default_rng(seed)
+    brightness = rng.integers(*AUGMENTATION_PARAMS['brightness'], size=len(df))
+    angles = rng.uniform(*AUGMENTATION_PARAMS['rotation'], size=len(df))
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        features = executor.map(lambda path, *params: extract_features(path, normalize, augment, params),
+                                img_paths, brightness, angles)
+        for i, features_list in enumerate(features):
+            X[i * n_aug:(i + 1) * n_aug] = features_list
+    y = np.repeat(df["Class"].to_numpy(), n_aug)
+    return X, y
+
+def load_or_compute_features(csv_path: str, image_dir: str, normalize: bool = True,
+                             augment: bool = False, seed: Optional[int] = None,
+                             cache_dir: str = "cache") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Same as `prepare_features` but memoizes the result to `cache_dir/<hash>.npz`.
+    The key covers the CSV mtime, every image path and mtime, ROI_SIZE, FEATURE_VERSION,
+    the flags and the augmentation seed, so editing the dataset or the feature code
+    invalidates the cache automatically. With augment=True pass a fixed seed: the
+    augmentation draws are part of the cached rows, and seed=None is not cached.
+    """
+    df, image_dir = load_data(csv_path, image_dir)
+    
+    key = hashlib.blake2b(digest_size=16)
+    key.update(repr((os.path.getmtime(csv_path), ROI_SIZE, FEATURE_VERSION,
+                     normalize, augment, augment and seed)).encode())
+    for image in sorted(df["Image"]):
+        img_path = os.path.join(image_dir, image)
+        key.update(repr((image, os.path.getmtime(img_path))).encode())
+    cache_path = os.path.join(cache_dir, f"{key.hexdigest()}.npz")
+    # Unseeded augmentation is meant to redraw every run
+    cacheable = not augment or seed is not None
+    
+    if cacheable and os.path.exists(cache_path):
+        data = np.load(cache_path)
+        return np.ascontiguousarray(data['X'], dtype=np.float32), data['y']
+    
+    X, y = prepare_features(df, image_dir, normalize, augment, seed)
+    if not cacheable:
+        return X, y
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez_compressed(cache_path, X=X, y=y)
+    return X, y
+
+def zscore_inplace(X: np.ndarray) -> np.ndarray:
+    """
+    Standardize features to zero mean and unit variance, like `StandardScaler().fit_transform`,
+    but on a single float32 buffer. X is modified in place when it is already contiguous float32.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    mu = X.mean(axis=0)
+    sd = X.std(axis=0)
+    sd[sd == 0] = 1
+    X -= mu
+    X /= sd
+    return X
+
+def minmax_inplace(X: np.ndarray) -> np.ndarray:
+    """
+    Scale features to [0, 1], like `MinMaxScaler().fit_transform`, on a single float32 buffer.
+    X is modified in place when it is already contiguous float32.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    lo = X.min(axis=0)
+    span = X.max(axis=0) - lo
+    span[span == 0] = 1
+    X -= lo
+    X /= span
+    return X
+
+def loo_minmax_bounds(X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-fold MinMaxScaler bounds for leave-one-out CV without refitting on every fold.
+    Row i holds each feature's min and range over X with sample i left out (a range of
+    0 becomes 1, as in MinMaxScaler); only folds that hold out an extremum differ.
+    """
+    order = np.argsort(X, axis=0)
+    held_out = np.arange(len(X))[:, None]
+    cols = np.arange(X.shape[1])
+    lo = np.where(order[0] == held_out, X[order[1], cols], X[order[0], cols])
+    hi = np.where(order[-1] == held_out, X[order[-2], cols], X[order[-1], cols])
+    span = hi - lo
+    span[span == 0] = 1
+    return lo, span
+
+def neighbor_weights(dist: np.ndarray, weights: str) -> np.ndarray:
+    """
+    KNeighbors* vote weights for the given neighbour distances: 'uniform', or 'distance'
+    (1/d, except that neighbours at distance 0 take all the weight, as sklearn does).
+    """
+    if weights == 'uniform':
+        return np.ones_like(dist)
+    exact = dist == 0
+    if exact.any():
+        return exact.astype(dist.dtype)
+    return 1.0 / dist
+
+def class_centroids(X: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-class centroids of X computed in one grouped pass instead of one mask per class.
+    Returns the sorted classes, the (n_classes, n_features) centroids and each sample's class index.
+    """
+    classes, label_idx = np.unique(y, return_inverse=True)
+    counts = np.bincount(label_idx, minlength=len(classes))
+    sums = np.zeros((len(classes), X.shape[1]))
+    np.add.at(sums, label_idx, X)
+    return classes, sums / counts[:, None], label_idx
 
 def plot_confusion_matrix(true_values: np.ndarray, predictions: np.ndarray) -> None:
     """Plot confusion matrix."""
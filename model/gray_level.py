@@ -25,14 +25,28 @@ def estimate_swc(G, G0=GL_0, Gs=GL_S, theta_s=THETA_S):
     theta = theta_s * (1 - np.sqrt(ratio))
     return theta
 
+def percentiles_u8(gray, qs):
+    """
+    Same as np.percentile(gray, qs) (linear interpolation) for a uint8 image, read off
+    the cumulative 256-bin histogram instead of sorting every pixel.
+    """
+    cdf = np.cumsum(cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel())
+    positions = np.asarray(qs, dtype=np.float64) / 100 * (gray.size - 1)
+    lo = np.floor(positions)
+    # The k-th smallest pixel is the first gray level whose cumulative count exceeds k
+    v_lo = np.searchsorted(cdf, lo, side='right')
+    v_hi = np.searchsorted(cdf, lo + 1, side='right')
+    return v_lo + (positions - lo) * (v_hi - v_lo)
+
 def normalize(gray):
     """
     Percentile normalization of the grayscale image.
     Maps the pixel values to the range [0, 255] based on the 1st and 99th percentiles.
     """
-    p1, p99 = np.percentile(gray, (1, 99))
-    normalized = np.clip((gray - p1) * 255.0 / (p99 - p1), 0, 255).astype(np.uint8)
-    return normalized
+    p1, p99 = percentiles_u8(gray, (1, 99))
+    # uint8 input, so the stretch is a 256-entry table applied with one cv2.LUT
+    lut = np.clip((np.arange(256) - p1) * 255.0 / (p99 - p1), 0, 255).astype(np.uint8)
+    return cv2.LUT(gray, lut)
 
 def preprocess_image(image, gloss_threshold=230):
     # Convert to grayscale and normalize
@@ -105,8 +119,10 @@ if __name__ == "__main__":
         cv2.imshow("Analyzed Image", img)
         
         print("Press any key or close the window to exit...")
+        # waitKey returns as soon as a key is pressed; the timeout only bounds how
+        # long closing the window takes to notice, since that raises no event
         while cv2.getWindowProperty('Analyzed Image', cv2.WND_PROP_VISIBLE) > 0:
-            keyCode = cv2.waitKey(100)
+            keyCode = cv2.waitKey(500)
             if keyCode != -1:
                 break
     finally:
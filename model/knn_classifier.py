@@ -1,39 +1,44 @@
 import numpy as np
 from sklearn.neighbors import KNeighborsClassifier
-from sklearn.model_selection import LeaveOneOut
 from sklearn.preprocessing import MinMaxScaler
-from classification_utils import prepare_features, load_data, perform_evaluation, save_model
+from classification_utils import (load_or_compute_features, loo_minmax_bounds, neighbor_weights,
+                                  perform_evaluation, save_model)
+
+AUGMENTATION_SEED = 42  # fixed so the cached augmented features are reproducible
 
 def perform_loocv(X, y, n_neighbors=3, weights='distance'):
-    loo = LeaveOneOut()
+    """
+    Leave-one-out CV of a KNN classifier. Each held-out sample's neighbours are read
+    off its distances to the rest instead of fitting a KNeighborsClassifier per fold;
+    the final fold's model and scaler are still fitted, to be saved.
+    """
+    classes, y_idx = np.unique(y, return_inverse=True)
+    _, loo_span = loo_minmax_bounds(X)
     predictions = []
-    true_values = []
     
-    for train_idx, test_idx in loo.split(X):
-        X_train, X_test = X[train_idx], X[test_idx]
-        y_train, y_test = y[train_idx], y[test_idx]
-        
-        scaler = MinMaxScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
-        
-        model = KNeighborsClassifier(n_neighbors=n_neighbors, weights=weights)
-        model.fit(X_train_scaled, y_train)
-        pred = model.predict(X_test_scaled)
-        
-        predictions.append(pred[0])
-        true_values.append(y_test[0])
-
-    # Save the model
+    for i in range(len(X)):
+        # Distances under fold i's MinMaxScaler; the min offset cancels in the differences
+        dist = np.sqrt((((X - X[i]) / loo_span[i]) ** 2).sum(axis=1))
+        dist[i] = np.inf  # held out
+        nn = np.argsort(dist, kind='stable')[:n_neighbors]
+        w = neighbor_weights(dist[nn], weights)
+        predictions.append(classes[np.bincount(y_idx[nn], weights=w, minlength=len(classes)).argmax()])
+    
+    # Save the model fitted on the last fold
+    X_train, y_train = X[:-1], y[:-1]
+    scaler = MinMaxScaler()
+    model = KNeighborsClassifier(n_neighbors=n_neighbors, weights=weights)
+    model.fit(scaler.fit_transform(X_train), y_train)
     save_model(model, scaler,
                feature_names=None, model_file="soil_knn_classifier.joblib", 
                model_type='KNN', class_names=['Dry', 'Moist', 'Wet'])
     
-    return np.array(predictions), np.array(true_values)
+    return np.array(predictions), np.array(y)
 
 def main():
-    df, image_dir = load_data("../new_samples/samples.csv", "../new_samples/")
-    X, y = prepare_features(df, image_dir, normalize=True, augment=True)
+    # Features are cached on disk, so tuning re-runs go straight to the LOOCV loop
+    X, y = load_or_compute_features("../new_samples/samples.csv", "../new_samples/",
+                                    normalize=True, augment=True, seed=AUGMENTATION_SEED)
     
     # Perform LOOCV
     predictions, true_values = perform_loocv(X, y, n_neighbors=3, weights='distance')
@@ -2,10 +2,11 @@ import pandas as pd
 import numpy as np
 import cv2
 import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import matplotlib.pyplot as plt
-from sklearn.neighbors import KNeighborsRegressor
-from sklearn.model_selection import LeaveOneOut
-from sklearn.preprocessing import MinMaxScaler
+from classification_utils import loo_minmax_bounds, neighbor_weights
 
 # Configuration constants
 APPLY_LIGHTING_NORMALIZATION = True
@@ -14,6 +15,8 @@ AUGMENTATION_PARAMS = {
     'brightness': [-10, 10],  # brightness adjustment range
     'rotation': [-5, 5],      # rotation angle range in degrees
 }
+AUGMENTATION_SEED = 42        # fixed so cached augmented features are reproducible
+FEATURE_VERSION = 1           # bump when extract_features changes, to rebuild caches
 
 def load_data(csv_path, image_dir):
     df = pd.read_csv(csv_path)
@@ -21,7 +24,9 @@ def load_data(csv_path, image_dir):
 
 def normalize_lighting(img):
     img_lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    img_lab[:, :, 0] = 128  # Fix brightness
+    # Fix brightness; mixChannels fills L in one pass, where the strided numpy
+    # assignment cost almost as much as a colour conversion
+    cv2.mixChannels([np.full(img.shape[:2], 128, np.uint8)], [img_lab], [0, 0])
     return cv2.cvtColor(img_lab, cv2.COLOR_LAB2BGR)
 
 def get_center_roi(img, roi_size):
@@ -45,67 +50,80 @@ def get_center_roi(img, roi_size):
     
     return img[start_y:end_y, start_x:end_x]
 
-def augment_image(img):
-    """Apply random augmentation to image."""
+@lru_cache(maxsize=128)
+def load_roi(image_path):
+    """Decoded, read-only centre ROI of an image, cached per path."""
+    img = cv2.imread(image_path)
+    if img is None:
+        raise FileNotFoundError(f"Image not found: {image_path}")
+    roi = get_center_roi(img, ROI_SIZE).copy()
+    roi.flags.writeable = False
+    return roi
+
+def augment_image(img, brightness=None, angle=None):
+    """Apply random augmentation to image, drawing any parameter not given."""
     augmented = []
     h, w = img.shape[:2]
     
-    # Original image
-    augmented.append(img.copy())
+    # Original image (only read downstream, so not copied)
+    augmented.append(img)
     
-    # Brightness adjustment
-    bright = img.copy()
-    bright = cv2.add(bright, np.random.randint(*AUGMENTATION_PARAMS['brightness']))
+    # Brightness adjustment; cv2.add writes a new image
+    if brightness is None:
+        brightness = np.random.randint(*AUGMENTATION_PARAMS['brightness'])
+    bright = cv2.add(img, int(brightness))
     augmented.append(bright)
     
     # Rotation
-    angle = np.random.uniform(*AUGMENTATION_PARAMS['rotation'])
+    if angle is None:
+        angle = np.random.uniform(*AUGMENTATION_PARAMS['rotation'])
+    angle = float(angle)
     matrix = cv2.getRotationMatrix2D((w/2, h/2), angle, 1.0)
     rotated = cv2.warpAffine(img, matrix, (w, h))
     augmented.append(rotated)
     
     return augmented
 
-def extract_features(image_path, normalize=True, augment=True):
-    img = cv2.imread(image_path)
-    if img is None:
-        raise FileNotFoundError(f"Image not found: {image_path}")
-    
-    img = get_center_roi(img, ROI_SIZE)
+def extract_features(image_path, normalize=True, augment=True, aug_params=None):
+    img = load_roi(image_path)
     if normalize:
         img = normalize_lighting(img)
     
     features_list = []
-    images_to_process = augment_image(img) if augment else [img]
+    images_to_process = augment_image(img, *(aug_params or ())) if augment else [img]
     
     for processed_img in images_to_process:
-        img_rgb = cv2.cvtColor(processed_img, cv2.COLOR_BGR2RGB)
         img_hsv = cv2.cvtColor(processed_img, cv2.COLOR_BGR2HSV)
         img_lab = cv2.cvtColor(processed_img, cv2.COLOR_BGR2LAB)
         
-        # Extract features from multiple color spaces
-        features = {}
+        # Extract features from multiple color spaces, one pass per color space.
+        # The layout matches the original name-keyed dict, where LAB's mean_B
+        # overwrote RGB's mean_B in place, giving 18 features.
+        features = np.empty(18, dtype=np.float32)
         
-        # RGB features
-        for i, channel in enumerate(['R', 'G', 'B']):
-            features[f'mean_{channel}'] = np.mean(img_rgb[:,:,i])
-            features[f'std_{channel}'] = np.std(img_rgb[:,:,i])
-            features[f'var_{channel}'] = np.var(img_rgb[:,:,i])
+        # RGB features, interleaved per channel: mean, std, var
+        # Taken on the BGR image and reversed, instead of converting to RGB
+        mean, std = cv2.meanStdDev(processed_img)
+        mean, std = mean[::-1], std[::-1]
+        features[0:9:3] = mean.ravel()
+        features[1:9:3] = std.ravel()
+        features[2:9:3] = std.ravel() ** 2
         
-        # HSV features
-        for i, channel in enumerate(['H', 'S', 'V']):
-            features[f'mean_{channel}'] = np.mean(img_hsv[:,:,i])
-            features[f'std_{channel}'] = np.std(img_hsv[:,:,i])
+        # HSV features, interleaved per channel: mean, std
+        mean, std = cv2.meanStdDev(img_hsv)
+        features[9:15:2] = mean.ravel()
+        features[10:15:2] = std.ravel()
         
-        # LAB features
-        for i, channel in enumerate(['L', 'A', 'B']):
-            features[f'mean_{channel}'] = np.mean(img_lab[:,:,i])
+        # LAB features (B lands in the mean_B slot)
+        mean_l, mean_a, mean_b, _ = cv2.mean(img_lab)
+        features[15:17] = mean_l, mean_a
+        features[6] = mean_b
         
         # Texture features (using grayscale)
         gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-        features['entropy'] = entropy(gray)
+        features[17] = entropy(gray)
         
-        features_list.append(list(features.values()))
+        features_list.append(features)
     
     return features_list
 
@@ -115,42 +133,76 @@ def entropy(img):
     hist = hist.ravel() / hist.sum()
     return -np.sum(hist * np.log2(hist + 1e-7))
 
-def prepare_features(df, image_dir, normalize=True, augment=True):
-    X, y = [], []
-    for _, row in df.iterrows():
-        img_path = os.path.join(image_dir, row["Image"])
-        features_list = extract_features(img_path, normalize, augment)
-        X.extend(features_list)
-        y.extend([row["Moisture"]] * len(features_list))
-    return np.array(X), np.array(y)
+def prepare_features(df, image_dir, normalize=True, augment=True, seed=None):
+    """
+    Extract features on a thread pool into a preallocated matrix, with every
+    image's augmentation parameters drawn up front from default_rng(seed).
+    """
+    n_aug = 3 if augment else 1
+    # float32 halves the bytes the LOOCV distance loop streams; inputs are uint8 statistics
+    X = np.empty((len(df) * n_aug, 18), dtype=np.float32)
+    img_paths = [os.path.join(image_dir, image) for image in df["Image"]]
+    rng = np.random.default_rng(seed)
+    brightness = rng.integers(*AUGMENTATION_PARAMS['brightness'], size=len(df))
+    angles = rng.uniform(*AUGMENTATION_PARAMS['rotation'], size=len(df))
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        features = executor.map(lambda path, *params: extract_features(path, normalize, augment, params),
+                                img_paths, brightness, angles)
+        for i, features_list in enumerate(features):
+            X[i * n_aug:(i + 1) * n_aug] = features_list
+    y = np.repeat(df["Moisture"].to_numpy(), n_aug)
+    return X, y
+
+def load_or_compute_features(csv_path, image_dir, normalize=True, augment=True, seed=None, cache_dir="cache"):
+    """
+    Same as `prepare_features` but memoizes the result to `cache_dir/knn_regressor_<hash>.npz`,
+    keyed on the CSV mtime, every image path and mtime, ROI_SIZE, FEATURE_VERSION, the
+    flags and the augmentation seed. Unseeded augmented features are not cached.
+    """
+    df, image_dir = load_data(csv_path, image_dir)
+    
+    key = hashlib.blake2b(digest_size=16)
+    key.update(repr((os.path.getmtime(csv_path), ROI_SIZE, FEATURE_VERSION,
+                     normalize, augment, augment and seed)).encode())
+    for image in sorted(df["Image"]):
+        img_path = os.path.join(image_dir, image)
+        key.update(repr((image, os.path.getmtime(img_path))).encode())
+    cache_path = os.path.join(cache_dir, f"knn_regressor_{key.hexdigest()}.npz")
+    cacheable = not augment or seed is not None
+    
+    if cacheable and os.path.exists(cache_path):
+        data = np.load(cache_path)
+        return np.ascontiguousarray(data['X'], dtype=np.float32), data['y']
+    
+    X, y = prepare_features(df, image_dir, normalize, augment, seed)
+    if not cacheable:
+        return X, y
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez_compressed(cache_path, X=X, y=y)
+    return X, y
 
 def perform_loocv(X, y, n_neighbors=3, weights='distance'):
-    loo = LeaveOneOut()
+    """
+    Leave-one-out CV of a KNN regressor. Each held-out sample's neighbours are read
+    off its distances to the rest instead of fitting a KNeighborsRegressor per fold.
+    """
+    _, loo_span = loo_minmax_bounds(X)
     predictions = []
-    true_values = []
     
-    for train_idx, test_idx in loo.split(X):
-        X_train, X_test = X[train_idx], X[test_idx]
-        y_train, y_test = y[train_idx], y[test_idx]
-        
-        # Scale features
-        scaler = MinMaxScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
-        
-        # Train and predict
-        model = KNeighborsRegressor(n_neighbors=n_neighbors, weights=weights)
-        model.fit(X_train_scaled, y_train)
-        pred = model.predict(X_test_scaled)
-        
-        predictions.append(pred[0])
-        true_values.append(y_test[0])
+    for i in range(len(X)):
+        # Distances under fold i's MinMaxScaler; the min offset cancels in the differences
+        dist = np.sqrt((((X - X[i]) / loo_span[i]) ** 2).sum(axis=1))
+        dist[i] = np.inf  # held out
+        nn = np.argsort(dist, kind='stable')[:n_neighbors]
+        w = neighbor_weights(dist[nn], weights)
+        predictions.append(np.dot(w, y[nn]) / w.sum())
     
-    return np.array(predictions), np.array(true_values)
+    return np.array(predictions), np.array(y)
 
 def main():
-    df, image_dir = load_data("../new_samples/samples.csv", "../new_samples/")
-    X, y = prepare_features(df, image_dir, normalize=APPLY_LIGHTING_NORMALIZATION, augment=True)
+    X, y = load_or_compute_features("../new_samples/samples.csv", "../new_samples/",
+                                    normalize=APPLY_LIGHTING_NORMALIZATION, augment=True,
+                                    seed=AUGMENTATION_SEED)
     
     # Perform LOOCV
     predictions, true_values = perform_loocv(X, y, n_neighbors=3, weights='distance')
@@ -72,20 +72,16 @@ def extract_features(img: np.ndarray) -> np.ndarray:
     lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
-    # RGB statistics (mean, std, var for each channel)
-    for i in range(3):
-        features.append(np.mean(rgb[:,:,i]))
-        features.append(np.std(rgb[:,:,i]))
-        features.append(np.var(rgb[:,:,i]))
+    # RGB statistics (mean, std, var for each channel), one pass over all channels
+    mean, std = cv2.meanStdDev(rgb)
+    features.extend(np.column_stack((mean.ravel(), std.ravel(), std.ravel() ** 2)).ravel())
     
-    # HSV statistics
-    for i in range(3):
-        features.append(np.mean(hsv[:,:,i]))
-        features.append(np.std(hsv[:,:,i]))
+    # HSV statistics (mean, std for each channel)
+    mean, std = cv2.meanStdDev(hsv)
+    features.extend(np.column_stack((mean.ravel(), std.ravel())).ravel())
     
     # LAB statistics
-    for i in range(3):
-        features.append(np.mean(lab[:,:,i]))
+    features.extend(cv2.mean(lab)[:3])
     
     # Texture features from grayscale
     features.append(entropy(gray))
@@ -98,8 +94,9 @@ def extract_features(img: np.ndarray) -> np.ndarray:
     
     # Add Haralick texture features (simplified)
     glcm = cv2.GaussianBlur(gray, (5, 5), 0)
-    features.append(np.mean(glcm))
-    features.append(np.std(glcm))
+    mean, std = cv2.meanStdDev(glcm)
+    features.append(mean[0, 0])
+    features.append(std[0, 0])
     
     return np.array(features)
 
@@ -119,8 +116,8 @@ def load_image_data(csv_path: str, image_dir: str) -> Tuple[List[np.ndarray], Li
     
     print(f"Found {len(df)} entries in the dataset")
     
-    for _, row in df.iterrows():
-        img_path = os.path.join(image_dir, row["Image"])
+    for image, label in zip(df["Image"].to_numpy(), df["Class"].to_numpy()):
+        img_path = os.path.join(image_dir, image)
         
         if not os.path.exists(img_path):
             print(f"Warning: Image not found at {img_path}")
@@ -137,7 +134,7 @@ def load_image_data(csv_path: str, image_dir: str) -> Tuple[List[np.ndarray], Li
         img = normalize_lighting(img)
         
         images.append(img)
-        labels.append(row["Class"])
+        labels.append(label)
     
     print(f"Successfully loaded {len(images)} images")
     return images, labels
@@ -1,5 +1,6 @@
 """SVM Classifier and SVR Regressor for Old Research dataset"""
 import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split, KFold, cross_val_score
@@ -8,11 +9,15 @@ from sklearn.metrics import classification_report, r2_score, mean_absolute_error
 from skimage.io import imread
 from sklearn.preprocessing import StandardScaler
 
+def filter_existing_images(df, image_dir):
+    """Keep only the rows whose image file exists in image_dir."""
+    present = set(os.listdir(image_dir))
+    mask = df['Image_Path'].str.rsplit('/', n=1).str[-1].isin(present)
+    return df.loc[mask].reset_index(drop=True)
+
 # Load and preprocess the dataset
 def load_and_preprocess_data(csv_path, image_dir):
-    df = pd.read_csv(csv_path)
-    df = df[df['Image_Path'].apply(lambda x: os.path.exists(f"{image_dir}/{x.split('/')[-1]}"))]
-    df = df.reset_index(drop=True)
+    df = filter_existing_images(pd.read_csv(csv_path), image_dir)
     df['Moisture_Class'] = pd.qcut(df['Moisture'], q=3, labels=['Low', 'Medium', 'High'])
     return df
 
@@ -28,41 +33,38 @@ def load_and_preprocess_data_multiple(csv_paths, image_dirs):
     """
     dataframes = []
     for csv_path, image_dir in zip(csv_paths, image_dirs):
-        df = pd.read_csv(csv_path)
-        df = df[df['Image_Path'].apply(lambda x: os.path.exists(f"{image_dir}/{x.split('/')[-1]}"))]
-        df = df.reset_index(drop=True)
+        df = filter_existing_images(pd.read_csv(csv_path), image_dir)
         dataframes.append(df)
     combined_df = pd.concat(dataframes, ignore_index=True)
     combined_df['Moisture_Class'] = pd.qcut(combined_df['Moisture'], q=3, labels=['Low', 'Medium', 'High'])
     return combined_df
 
+def _mean_rgb(image_dirs, path):
+    """Mean R, G, B of the first RGB copy of path in image_dirs, or None."""
+    for image_dir in image_dirs:
+        image_path = f"{image_dir}/{path.split('/')[-1]}"
+        if os.path.exists(image_path):
+            image = imread(image_path)
+            if image.ndim == 3:  # Ensure the image is RGB
+                return image.mean(axis=(0, 1))  # Mean R, G, B values
+            print(f"Image {image_path} is not RGB, skipping.")
+    print(f"Image {path} not found in any of the provided directories, skipping.")
+    return None
+
 # Extract RGB features from images
 def extract_rgb_features(image_dirs, image_paths):
     """
     Extract RGB features from images in multiple directories.
+    Images are decoded on a thread pool; the decoders release the GIL.
     Args:
         image_dirs (list): List of directories containing images.
         image_paths (pd.Series): Series of image paths.
     Returns:
         np.array: Array of extracted RGB features.
     """
-    features = []
-    for path in image_paths:
-        image_found = False
-        for image_dir in image_dirs:
-            image_path = f"{image_dir}/{path.split('/')[-1]}"
-            if os.path.exists(image_path):
-                image = imread(image_path)
-                if image.ndim == 3:  # Ensure the image is RGB
-                    mean_rgb = image.mean(axis=(0, 1))  # Mean R, G, B values
-                    features.append(mean_rgb)
-                    image_found = True
-                    break
-                else:
-                    print(f"Image {image_path} is not RGB, skipping.")
-        if not image_found:
-            print(f"Image {path} not found in any of the provided directories, skipping.")
-    return np.array(features)
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4)) as executor:
+        features = executor.map(lambda path: _mean_rgb(image_dirs, path), image_paths)
+        return np.array([f for f in features if f is not None])
 
 # Updated main functions to use multiple datasets
 def train_svm_classifier(csv_paths, image_dirs):
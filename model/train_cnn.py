@@ -1,13 +1,17 @@
 """CNN For old research dataset"""
 import os
+import hashlib
+import contextlib
+from functools import partial
 import numpy as np
 import pandas as pd
-from PIL import Image
 import matplotlib.pyplot as plt
 import torch
 import torch.nn as nn
 import torch.optim as optim
-import torchvision.transforms as transforms
+# Batched (list) decode_jpeg and nvJPEG decoding on CUDA need torchvision >= 0.19
+from torchvision.io import read_file, decode_image, decode_jpeg, ImageReadMode
+from torchvision.transforms import v2
 from torch.utils.data import Dataset, DataLoader
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import root_mean_squared_error, mean_absolute_error, r2_score
@@ -23,47 +27,141 @@ def load_and_preprocess_data(csv_path, image_dir):
         pd.DataFrame: Preprocessed DataFrame with image paths and labels.
     """
     df = pd.read_csv(csv_path)
-    df = df[df['Image_Path'].apply(lambda x: os.path.exists(f"{image_dir}/{x.split('/')[-1]}"))]
-    df = df.reset_index(drop=True)
+    present = set(os.listdir(image_dir))
+    mask = df['Image_Path'].str.rsplit('/', n=1).str[-1].isin(present)
+    df = df.loc[mask].reset_index(drop=True)
     return df
 
 # Define the custom dataset
 class SoilMoistureDataset(Dataset):
     """
     Custom dataset for loading soil moisture images and their corresponding labels.
+    Samples are the still-encoded image bytes; decoding and the transforms run per
+    batch on the training device (see DeviceLoader). With cache_path (see
+    load_or_build_cache) samples are instead the already transformed float16
+    tensors, read from a memory-mapped .npy file.
     """
-    def __init__(self, dataframe, image_dirs, transform=None):
+    def __init__(self, dataframe, image_dirs, cache_path=None):
         self.dataframe = dataframe
+        self.cache = np.load(cache_path, mmap_mode='r') if cache_path else None
         self.image_dirs = image_dirs if isinstance(image_dirs, list) else [image_dirs]
-        self.transform = transform
+
+        # Resolve every image to the first directory holding it, with one listdir
+        # per directory instead of a stat per sample per epoch
+        basenames = dataframe['Image_Path'].str.rsplit('/', n=1).str[-1]
+        resolved = np.full(len(dataframe), None, dtype=object)
+        for image_dir in reversed(self.image_dirs):
+            found = basenames.isin(set(os.listdir(image_dir))).to_numpy()
+            resolved[found] = (image_dir + "/" + basenames[found]).to_numpy()
+        self.image_paths = resolved.tolist()
 
     def __len__(self):
         return len(self.dataframe)
 
     def __getitem__(self, idx):
-        img_path = self.dataframe['Image_Path'].iloc[idx]
-        for image_dir in self.image_dirs:
-            full_path = f"{image_dir}/{img_path.split('/')[-1]}"
-            if os.path.exists(full_path):
-                img_path = full_path
-                break
-        else:
-            raise FileNotFoundError(f"Image {img_path} not found in provided directories.")
+        if self.cache is not None:
+            label = torch.tensor(self.dataframe.iloc[idx]['Moisture'], dtype=torch.float32)
+            return torch.from_numpy(np.array(self.cache[idx])), label
+
+        img_path = self.image_paths[idx]
+        if img_path is None:
+            raise FileNotFoundError(f"Image {self.dataframe['Image_Path'].iloc[idx]} not found in provided directories.")
 
         label = torch.tensor(self.dataframe.iloc[idx]['Moisture'], dtype=torch.float32)
-        image = Image.open(img_path).convert("RGB")
-        if self.transform:
-            image = self.transform(image)
-        return image, label
+        return read_file(img_path), label
+
+def collate_encoded(batch, decode=False):
+    """
+    Collate encoded images into a list (they differ in size) and stack the labels.
+    With decode=True the batch is decoded here, inside the DataLoader worker, for
+    devices without nvJPEG. decode_image handles PNG as well as JPEG.
+    """
+    data, labels = zip(*batch)
+    data = list(data)
+    if decode:
+        data = [decode_image(encoded, mode=ImageReadMode.RGB) for encoded in data]
+    return data, torch.stack(labels)
+
+def is_jpeg(encoded):
+    """True if the encoded image bytes start with the JPEG SOI marker."""
+    return encoded[:2].tolist() == [0xFF, 0xD8]
+
+class DeviceLoader:
+    """
+    Wraps a DataLoader built with collate_encoded and yields batches that are
+    decoded, resized and normalized on the target device. On CUDA the JPEGs in a
+    batch are decoded together with nvJPEG (torchvision >= 0.19); anything else
+    is decoded on the CPU with decode_image. Batches from a cached dataset are
+    already transformed and are only moved.
+    """
+    def __init__(self, loader, device, transform):
+        self.loader = loader
+        self.dataset = loader.dataset
+        self.device = device
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for data, labels in self.loader:
+            if isinstance(data, torch.Tensor):
+                images = data.to(self.device, non_blocking=True).float()
+                yield images, labels.to(self.device, non_blocking=True)
+                continue
+            if self.device.type == "cuda":
+                jpegs = [encoded for encoded in data if is_jpeg(encoded)]
+                decoded = iter(decode_jpeg(jpegs, mode=ImageReadMode.RGB, device=self.device) if jpegs else [])
+                images = [next(decoded) if is_jpeg(encoded)
+                          else decode_image(encoded, mode=ImageReadMode.RGB).to(self.device, non_blocking=True)
+                          for encoded in data]
+            else:
+                images = [image.to(self.device, non_blocking=True) for image in data]
+            images = torch.stack([self.transform(image) for image in images])
+            yield images, labels.to(self.device, non_blocking=True)
 
-# Define transformations
+# Define transformations (applied to uint8 image tensors on the device)
 def get_transforms():
-    return transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    return v2.Compose([
+        v2.Resize((224, 224), antialias=True),
+        v2.ToDtype(torch.float32, scale=True),
+        v2.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
     ])
 
+def load_or_build_cache(dataframe, image_dirs, device, transform, cache_dir="cache"):
+    """
+    Decode and transform every image once into a float16 (N, 3, 224, 224) .npy file
+    under cache_dir and return its path. Resize and Normalize are deterministic, so
+    later epochs and runs only read the memory-mapped result. The key covers every
+    image path and mtime, so changing the dataset builds a new cache.
+    """
+    dataset = SoilMoistureDataset(dataframe, image_dirs)
+    key = hashlib.blake2b(digest_size=16)
+    for img_path in dataset.image_paths:
+        key.update(repr((img_path, img_path and os.path.getmtime(img_path))).encode())
+    cache_path = os.path.join(cache_dir, f"cnn_{key.hexdigest()}.npy")
+    if os.path.exists(cache_path):
+        return cache_path
+
+    loader = DeviceLoader(DataLoader(
+        dataset,
+        batch_size=64,
+        collate_fn=partial(collate_encoded, decode=device.type != "cuda"),
+        num_workers=os.cpu_count(),
+    ), device, transform)
+    os.makedirs(cache_dir, exist_ok=True)
+    cache = np.lib.format.open_memmap(cache_path + ".tmp", mode='w+', dtype=np.float16,
+                                      shape=(len(dataset), 3, 224, 224))
+    offset = 0
+    with torch.inference_mode():
+        for images, _ in loader:
+            cache[offset:offset + len(images)] = images.half().cpu().numpy()
+            offset += len(images)
+    cache.flush()
+    del cache
+    os.replace(cache_path + ".tmp", cache_path)
+    return cache_path
+
 # Define the CNN model
 class CNNModel(nn.Module):
     """
@@ -104,28 +202,48 @@ class CNNModel(nn.Module):
         return x
 
 # Train the model
-def train_model(model, train_loader, val_loader, criterion, optimizer, device, num_epochs=10):
+def train_model(model, train_loader, val_loader, criterion, optimizer, device, num_epochs=10, eval_model=None):
+    """
+    Train model and report the validation loss after every epoch. eval_model, if
+    given, is used for validation instead; pass the eager module when model is a
+    CUDA-graph compiled wrapper, so the ragged last validation batch does not
+    trigger a recompile and a new graph.
+    """
+    eval_model = model if eval_model is None else eval_model
+    if len(train_loader) == 0:
+        # drop_last discards a training set smaller than one batch entirely
+        raise ValueError("Training set is smaller than one batch; no training steps would run")
+    # Mixed precision on CUDA: bf16 where supported, otherwise fp16 with loss scaling
+    use_amp = device.type == "cuda"
+    amp_dtype = torch.bfloat16 if use_amp and torch.cuda.is_bf16_supported() else torch.float16
+    scaler = torch.amp.GradScaler("cuda", enabled=use_amp and amp_dtype == torch.float16)
     for epoch in range(num_epochs):
         model.train()
-        running_loss = 0.0
+        running_loss, seen = 0.0, 0
         for images, labels in train_loader:
-            images, labels = images.to(device), labels.to(device).view(-1, 1)
-            outputs = model(images)
-            loss = criterion(outputs, labels)
+            images = images.to(device, memory_format=torch.channels_last, non_blocking=True)
+            labels = labels.to(device).view(-1, 1)
+            with torch.autocast("cuda", dtype=amp_dtype) if use_amp else contextlib.nullcontext():
+                outputs = model(images)
+                loss = criterion(outputs.float(), labels)
             optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
             running_loss += loss.item() * images.size(0)
-        epoch_loss = running_loss / len(train_loader.dataset)
+            seen += images.size(0)
+        epoch_loss = running_loss / seen
         print(f"Epoch {epoch+1}/{num_epochs}, Train Loss: {epoch_loss:.4f}")
 
-        model.eval()
+        eval_model.eval()
         val_loss = 0.0
-        with torch.no_grad():
+        with torch.inference_mode():
             for images, labels in val_loader:
-                images, labels = images.to(device), labels.to(device).view(-1, 1)
-                outputs = model(images)
-                loss = criterion(outputs, labels)
+                images = images.to(device, memory_format=torch.channels_last, non_blocking=True)
+                labels = labels.to(device).view(-1, 1)
+                with torch.autocast("cuda", dtype=amp_dtype) if use_amp else contextlib.nullcontext():
+                    outputs = eval_model(images)
+                loss = criterion(outputs.float(), labels)
                 val_loss += loss.item() * images.size(0)
         val_epoch_loss = val_loss / len(val_loader.dataset)
         print(f"Epoch {epoch+1}/{num_epochs}, Val Loss: {val_epoch_loss:.4f}")
@@ -134,13 +252,22 @@ def train_model(model, train_loader, val_loader, criterion, optimizer, device, n
 # Evaluate the model with statistical metrics
 def evaluate_model(model, val_loader, device):
     model.eval()
-    predictions, true_labels = [], []
-    with torch.no_grad():
+    # Results stay on the device, with one device-to-host copy for the whole set
+    num_samples = len(val_loader.dataset)
+    predictions = torch.empty(num_samples, device=device)
+    true_labels = torch.empty(num_samples, device=device)
+    offset = 0
+    with torch.inference_mode():
         for images, labels in val_loader:
-            images, labels = images.to(device), labels.to(device).view(-1, 1)
+            images = images.to(device, memory_format=torch.channels_last, non_blocking=True)
             outputs = model(images)
-            predictions.extend(outputs.cpu().numpy().flatten())
-            true_labels.extend(labels.cpu().numpy().flatten())
+            batch_size = images.size(0)
+            predictions[offset:offset + batch_size] = outputs.flatten()
+            true_labels[offset:offset + batch_size] = labels.to(device).flatten()
+            offset += batch_size
+
+    predictions = predictions[:offset].cpu().numpy()
+    true_labels = true_labels[:offset].cpu().numpy()
 
     # Compute statistical metrics
     r2 = r2_score(true_labels, predictions)
@@ -152,8 +279,8 @@ def evaluate_model(model, val_loader, device):
 
 # Visualize predictions vs true labels
 def visualize_predictions(predictions, true_labels):
-    predictions = np.array(predictions)
-    true_labels = np.array(true_labels)
+    predictions = np.asarray(predictions)
+    true_labels = np.asarray(true_labels)
     plt.figure(figsize=(10, 5))
     plt.scatter(true_labels, predictions, alpha=0.5)
     plt.plot([true_labels.min(), true_labels.max()], [true_labels.min(), true_labels.max()], 'r--')
@@ -173,23 +300,42 @@ def main():
     df2 = load_and_preprocess_data(csv_path2, image_dir2)
     df = pd.concat([df1, df2], ignore_index=True)
 
+    device = torch.device("mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu")
+
     transform = get_transforms()
     train_df, val_df = train_test_split(df, test_size=0.2, random_state=42)
-    train_dataset = SoilMoistureDataset(train_df, [image_dir1, image_dir2], transform=transform)
-    val_dataset = SoilMoistureDataset(val_df, [image_dir1, image_dir2], transform=transform)
-    train_loader = DataLoader(train_dataset, batch_size=16, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=16, shuffle=False)
+    image_dirs = [image_dir1, image_dir2]
+    train_dataset = SoilMoistureDataset(train_df, image_dirs,
+                                        cache_path=load_or_build_cache(train_df, image_dirs, device, transform))
+    val_dataset = SoilMoistureDataset(val_df, image_dirs,
+                                      cache_path=load_or_build_cache(val_df, image_dirs, device, transform))
+    loader_kwargs = dict(
+        batch_size=16,
+        num_workers=os.cpu_count(),
+        persistent_workers=True,
+        pin_memory=device.type == "cuda",
+    )
+    # drop_last keeps every training batch the same shape for the compiled model
+    train_loader = DeviceLoader(DataLoader(train_dataset, shuffle=True, drop_last=True, **loader_kwargs), device, transform)
+    val_loader = DeviceLoader(DataLoader(val_dataset, shuffle=False, **loader_kwargs), device, transform)
 
+    # Fixed 224x224 inputs, so let cuDNN pick the fastest conv algorithms
+    torch.backends.cudnn.benchmark = True
     model = CNNModel(from_checkponit="soil_moisture_model.pth")
-    device = torch.device("mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu")
-    model = model.to(device)
+    model = model.to(device, memory_format=torch.channels_last)
     criterion = nn.MSELoss()
     optimizer = optim.Adam(model.parameters(), lr=0.001)
 
-    trained_model = train_model(model, train_loader, val_loader, criterion, optimizer, device, num_epochs=10)
-    torch.save(trained_model.state_dict(), "soil_moisture_model.pth")
+    # Fuse conv/bn/relu and replay with CUDA graphs; the eager module shares the
+    # weights and is what gets saved, so checkpoint keys stay unprefixed. Validation
+    # and evaluation run the eager module: their last batch is ragged
+    compiled_model = torch.compile(model, mode="reduce-overhead") if device.type == "cuda" else model
+
+    train_model(compiled_model, train_loader, val_loader, criterion, optimizer, device, num_epochs=10,
+                eval_model=model)
+    torch.save(model.state_dict(), "soil_moisture_model.pth")
 
-    predictions, true_labels = evaluate_model(trained_model, val_loader, device)
+    predictions, true_labels = evaluate_model(model, val_loader, device)
     visualize_predictions(predictions, true_labels)
 
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+from analysis import feature_analysis
+
+
+def _images():
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, size=(64, 48, 3), dtype=np.uint8)
+    # Smooth gradients put many pixels right on the gray-level bin edges
+    ramp = np.broadcast_to(np.arange(256, dtype=np.uint8)[:, None, None], (256, 8, 3))
+    ramp = np.ascontiguousarray(ramp + np.array([0, 3, 7], dtype=np.uint8))
+    return [noise, ramp]
+
+
+@pytest.mark.parametrize("image", _images())
+def test_numba_path_matches_opencv_path(image, monkeypatch):
+    fused = feature_analysis.extract_features(image)
+    monkeypatch.setattr(feature_analysis, "NUMBA_AVAILABLE", False)
+    reference = feature_analysis.extract_features(image)
+
+    assert fused.shape == reference.shape == (45,)
+    # Gray histogram bins must agree exactly
+    np.testing.assert_array_equal(fused[12:44], reference[12:44])
+    np.testing.assert_allclose(fused, reference, rtol=1e-6, atol=1e-6)